@@ -1,22 +1,25 @@
+import copy
 import logging
 from abc import abstractmethod
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from enum import Enum, auto
-from typing import Callable, Optional
+from typing import Callable, ClassVar, Hashable, Optional
 
 from ability import Ability, AbilitySkill
 from action_cost import ActionCost
+from attack_table import AttackOutcomeTable, get_attack_outcome_table
 from character import Character
 from damage import Damage
 from dices import DiceBag
-from event import Choice, Event, EventSteps, RandomOutcome
-from module import Module
-from probability import RandomVariable, advantage_disadvantage
+from event import (Choice, Event, EventSteps, RandomOutcome, compile_transitions,
+                   get_transition_validation)
+from module import Module, Subscription
+from probability import advantage_disadvantage
 from weapon import Weapon
 
 LOGGER = logging.getLogger('dnd')
 
-@dataclass
+@dataclass(slots=True)
 class AbilityContest:
     originator_ability_skill: AbilitySkill
     target_ability_skill: AbilitySkill
@@ -30,8 +33,7 @@ class AbilityContest:
         contester_roll = advantage_disadvantage(contester_roll, self.origin_advantage, self.origin_disadvantage)
         contested_roll = target.ability_check(self.target_ability_skill)
         contested_roll = advantage_disadvantage(contested_roll, self.target_advantage, self.target_disadvantage)
-        final_roll = contester_roll - contested_roll
-        contest_success_probability = final_roll.probability_of_being_superior_or_equal_to(1)
+        contest_success_probability = contester_roll.probability_of_being_superior_to(contested_roll)
         success_outcome = RandomOutcome(
             probability=contest_success_probability,
             name=EventSteps.CONTEST_SUCCESS
@@ -42,7 +44,7 @@ class AbilityContest:
         )
         return [success_outcome, failure_outcome]
 
-@dataclass
+@dataclass(slots=True)
 class Attack:
     damage: Damage = field(default_factory=Damage)
     advantage: bool = False
@@ -50,33 +52,27 @@ class Attack:
     roll_modifiers: DiceBag = field(default_factory=DiceBag)
     weapon_used: Weapon | None = None
 
-    def get_random_outcomes(self, target_armor_class: int, base_roll_distribution: RandomVariable) -> list[RandomOutcome]:
-        attack_roll_without_modifiers = advantage_disadvantage(
-            base_roll_distribution,
-            self.advantage,
-            self.disadvantage
-        )
-        fumble_outcome = RandomOutcome(
-            probability=attack_roll_without_modifiers.probability_of_being_between(1, 1),
-            name=EventSteps.FUMBLE
-        )
-        crit_outcome = RandomOutcome(
-            probability=attack_roll_without_modifiers.probability_of_being_between(20, 20),
-            name=EventSteps.CRIT
-        )
-        attack_roll_with_modifiers = attack_roll_without_modifiers + self.roll_modifiers.as_random_variable()
-        regular_hit_outcome = RandomOutcome(
-            probability=attack_roll_with_modifiers.probability_of_being_superior_or_equal_to(target_armor_class) - crit_outcome.probability,
-            name=EventSteps.REGULAR_HIT
-        )
-        regular_miss_outcome = RandomOutcome(
-            probability=1 - fumble_outcome.probability - crit_outcome.probability - regular_hit_outcome.probability,
-            name=EventSteps.REGULAR_MISS
-        )
-        return [fumble_outcome, crit_outcome, regular_hit_outcome, regular_miss_outcome]
+    def outcome_table(self, reroll_fumbles: bool = False) -> AttackOutcomeTable:
+        """Outcomes against every armor class, shared by all attacks with the same roll"""
+        return get_attack_outcome_table(self.advantage, self.disadvantage, reroll_fumbles, self.roll_modifiers)
+
+    def get_random_outcomes(self, target_armor_class: int, reroll_fumbles: bool = False) -> list[RandomOutcome]:
+        return self.outcome_table(reroll_fumbles).random_outcomes(target_armor_class)
+
+    def save(self) -> object:
+        """Modules change damage and advantages of an attack while it is processed"""
+        return self.damage.copy(), self.advantage, self.disadvantage, self.roll_modifiers
+
+    def restore(self, snapshot: object) -> None:
+        assert isinstance(snapshot, tuple)
+        damage, self.advantage, self.disadvantage, self.roll_modifiers = snapshot
+        self.damage = damage.copy()
+
+    def copy(self) -> 'Attack':
+        return replace(self, damage=self.damage.copy())
 
 
-@dataclass
+@dataclass(slots=True)
 class SavingThrow:
     ability: Ability
     difficulty_class: int # Saving Throw DC
@@ -86,6 +82,9 @@ class SavingThrow:
     roll_modifiers: DiceBag = field(default_factory=DiceBag)
     save_or_half: bool = False
 
+    def copy(self) -> 'SavingThrow':
+        return replace(self, damage=self.damage.copy())
+
 
 ACTION_WORKFLOW: dict[EventSteps, EventSteps | list[EventSteps]] = {
     EventSteps.BEFORE_EVENT: [
@@ -157,9 +156,54 @@ class WorkFlowPattern(Enum):
                 return EventSteps.END
         raise NotImplementedError(f'There is no deterministic implemented next step for {self=}, {current_step=}')
 
+    def transitions(self) -> 'WorkFlowTransitions':
+        return WORKFLOW_TRANSITIONS[self]
 
 
-@dataclass(kw_only=True)
+@dataclass(frozen=True, slots=True)
+class WorkFlowTransitions:
+    """Workflow of a pattern compiled in tables indexed by step ordinal"""
+    next_steps: tuple[EventSteps | None, ...] # Deterministic next step, None when it depends on a random outcome
+    random_steps: tuple[frozenset[EventSteps], ...] # Possible random outcomes, only used for validation
+
+    @staticmethod
+    def compile(workflow_pattern: WorkFlowPattern) -> 'WorkFlowTransitions':
+        next_steps = {}
+        for step in EventSteps:
+            try:
+                next_steps[step] = workflow_pattern.next_step(step)
+            except NotImplementedError:
+                continue
+        # Random outcomes of the action workflow, only for the steps reached by the pattern
+        random_steps: dict[EventSteps, frozenset[EventSteps]] = {}
+        to_visit = [EventSteps.BEFORE_EVENT]
+        reached = set(to_visit)
+        while len(to_visit) > 0:
+            step = to_visit.pop()
+            if step in next_steps:
+                following_steps = [next_steps[step]]
+            elif isinstance(next_action_steps := ACTION_WORKFLOW.get(step), list):
+                random_steps[step] = frozenset(next_action_steps)
+                following_steps = next_action_steps
+            else:
+                following_steps = []
+            to_visit.extend(following_step for following_step in following_steps if following_step not in reached)
+            reached.update(following_steps)
+        return WorkFlowTransitions(
+            next_steps=compile_transitions(next_steps),
+            random_steps=tuple(random_steps.get(step, frozenset()) for step in EventSteps),
+        )
+
+
+WORKFLOW_TRANSITIONS = {workflow_pattern: WorkFlowTransitions.compile(workflow_pattern) for workflow_pattern in WorkFlowPattern}
+
+
+
+def no_callback() -> None:
+    pass
+
+
+@dataclass(kw_only=True, slots=True)
 class ActionEvent(Event):
     is_an_attack: bool
     is_a_spell: bool
@@ -168,7 +212,7 @@ class ActionEvent(Event):
     attack: Attack | None = None
     saving_throw: SavingThrow | None = None
     ability_contest: AbilityContest | None = None
-    on_action_selected_callback: Callable[[], None] = lambda: None
+    on_action_selected_callback: Callable[[], None] = no_callback # Must be picklable for parallel search
     reroll_fumbles: bool = False # Lucky feat of halfling
     target: Optional[Character] = None # What about AoE and cells ? -> None mean we need to define target later
 
@@ -200,45 +244,104 @@ class ActionEvent(Event):
         assert self.event_step is EventSteps.BEFORE_ATTACK
         assert self.attack is not None
         assert self.target is not None
-        return self.attack.get_random_outcomes(self.target.armor_class)
+        return self.attack.get_random_outcomes(self.target.armor_class, self.reroll_fumbles)
+
+    def choice_name(self, target: Character | None) -> str:
+        return f'{self.action_module.__name__} on {target.name if target is not None else None}'
+
+    def instantiate(self, target: Character | None) -> 'ActionEvent':
+        """Copy of an action template, modules change the attack and saving throw of the processed action"""
+        action_event = copy.copy(self)
+        action_event.target = target
+        if self.attack is not None:
+            action_event.attack = self.attack.copy()
+        if self.saving_throw is not None:
+            action_event.saving_throw = self.saving_throw.copy()
+        return action_event
+
+    def save(self) -> object:
+        # Zero argument super() is not available in slotted dataclasses
+        return Event.save(self), self.attack.save() if self.attack is not None else None
+
+    def restore(self, snapshot: object) -> None:
+        assert isinstance(snapshot, tuple)
+        event_snapshot, attack_snapshot = snapshot
+        Event.restore(self, event_snapshot)
+        if self.attack is not None:
+            self.attack.restore(attack_snapshot)
 
     def do_outcome(self, outcome: RandomOutcome | Choice | None) -> None:
-        LOGGER.debug(f'Calling apply outcome with outcome={outcome} and self.current_action_step={self.event_step}')
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug(f'Calling apply outcome with outcome={outcome} and self.current_action_step={self.event_step}')
         self.event_processing_module_index = 0
         if isinstance(outcome, RandomOutcome):
-            # Workflow verification
-            next_action_steps = ACTION_WORKFLOW[self.event_step]
-            assert isinstance(next_action_steps, list)
-            assert outcome.name in next_action_steps
+            if get_transition_validation() and outcome.name not in self.workflow_pattern().transitions().random_steps[self.event_step.ordinal]:
+                raise ValueError(f'{outcome.name} cannot follow {self.event_step}')
             self.event_step = outcome.name
             if self.event_step is EventSteps.CRIT:
                 assert self.attack is not None
                 self.attack.damage = self.attack.damage.as_critical()
         else:
-            assert outcome is None
-            if self.event_step in [EventSteps.REGULAR_HIT, EventSteps.CRIT]:
+            if get_transition_validation() and outcome is not None:
+                raise ValueError(f'{self.event_step} has a deterministic next step, {outcome} cannot be applied')
+            if self.event_step is EventSteps.REGULAR_HIT or self.event_step is EventSteps.CRIT:
                 assert self.target is not None
                 assert self.attack is not None
                 self.target.takes_damage(self.attack.damage)
-            self.event_step = self.workflow_pattern().next_step(self.event_step)
+            next_step = self.workflow_pattern().transitions().next_steps[self.event_step.ordinal]
+            if next_step is None:
+                raise NotImplementedError(f'There is no deterministic implemented next step for {self.workflow_pattern()}, {self.event_step=}')
+            self.event_step = next_step
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class ChoosingActionEvent(Event):
     possible_actions: list[Event] = field(init=False, default_factory=list) # Field will be filled by modules
 
+    def save(self) -> object:
+        return Event.save(self), list(self.possible_actions)
 
+    def restore(self, snapshot: object) -> None:
+        assert isinstance(snapshot, tuple)
+        event_snapshot, possible_actions = snapshot
+        self.possible_actions = list(possible_actions)
+        Event.restore(self, event_snapshot)
+
+
+@dataclass(kw_only=True)
 class ActionModule(Module):
+    """
+    Module offering an action when its character chooses what to do
+
+    Actions are built once per template key and offered as templates,
+    only the chosen one is instantiated
+    """
+    subscriptions: ClassVar[tuple[Subscription, ...]] = (
+        Subscription((ChoosingActionEvent,), frozenset({EventSteps.AFTER_EVENT}), own_events_only=True),
+    )
+    # Not part of the module state: templates only depend on their key
+    action_templates: dict[Hashable, Event] = field(init=False, default_factory=dict, repr=False, compare=False)
+
     @abstractmethod
     def get_action_event(self) -> Event:
         pass
 
+    def action_template_key(self) -> Hashable:
+        """Resources the action event depends on, modules building different actions during a fight must override it"""
+        return None
+
+    def get_action_template(self) -> Event:
+        key = self.action_template_key()
+        if key not in self.action_templates:
+            self.action_templates[key] = self.get_action_event()
+        return self.action_templates[key]
+
     def on_event(self, event: Event, chosen_outcome: RandomOutcome | Choice | None) -> Event | None:
         if not isinstance(event, ChoosingActionEvent) or event.event_step != EventSteps.AFTER_EVENT or event.origin_character != self.origin_character:
             return None
-        possible_action = self.get_action_event()
+        possible_action = self.get_action_template()
         if is_event_cost_available(possible_action):
-            event.possible_actions.append(self.get_action_event())
+            event.possible_actions.append(possible_action)
         return None
 
 def is_event_cost_available(event: Event) -> bool:
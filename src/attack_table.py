@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+
+import numpy as np
+import numpy.typing as npt
+
+from cache import LRUCache
+from dices import DiceBag
+from event import EventSteps, RandomOutcome
+from probability import (Probability, UnreducedFraction,
+                         advantage_disadvantage, convolve,
+                         exact_weights_dtype, get_d20_roll,
+                         get_probability_mode)
+
+@dataclass(eq=False)
+class AttackOutcomeTable:
+    """Attack roll outcomes against any armor class
+
+    Probabilities are stored as weights over a shared denominator (1 in float mode)
+    Fumble and crit only depend on the natural roll, regular hits are indexed by armor class from lowest_armor_class:
+    every regular roll hits a lower armor class and the final weight, 0, is the one of any higher armor class
+    """
+    fumble_weight: int | float
+    crit_weight: int | float
+    regular_weight: int | float
+    regular_hit_weights: npt.NDArray
+    lowest_armor_class: int
+    denominator: int
+    is_exact: bool
+
+    @staticmethod
+    def compute(advantage: bool, disadvantage: bool, reroll_fumbles: bool, roll_modifiers: DiceBag) -> 'AttackOutcomeTable':
+        natural_roll = advantage_disadvantage(get_d20_roll(reroll_fumbles), advantage, disadvantage)
+        modifiers = roll_modifiers.as_random_variable()
+        assert natural_roll.offset == 1 and len(natural_roll.weights) == 20
+        is_exact = natural_roll.is_exact()
+        denominator = natural_roll.denominator * modifiers.denominator
+        dtype = exact_weights_dtype(denominator) if is_exact else np.float64
+        # A regular hit is a natural roll between 2 and 19 that reaches the armor class with modifiers
+        regular_natural_weights: npt.NDArray = natural_roll.weights.astype(dtype)
+        regular_natural_weights[[0, -1]] = 0
+        regular_total_weights = convolve(regular_natural_weights, modifiers.weights.astype(dtype))
+        # regular_hit_weights[i] is the weight of totals >= offset + i, padded with a final 0
+        regular_hit_weights: npt.NDArray = np.append(np.cumsum(regular_total_weights[::-1])[::-1], 0).astype(dtype)
+        fumble_weight = natural_roll.weights[0].item() * modifiers.denominator
+        crit_weight = natural_roll.weights[-1].item() * modifiers.denominator
+        return AttackOutcomeTable(
+            fumble_weight=fumble_weight,
+            crit_weight=crit_weight,
+            regular_weight=denominator - fumble_weight - crit_weight,
+            regular_hit_weights=regular_hit_weights,
+            lowest_armor_class=natural_roll.offset + modifiers.offset,
+            denominator=denominator,
+            is_exact=is_exact,
+        )
+
+    def probability(self, weight: int | float) -> Probability:
+        if self.is_exact:
+            return UnreducedFraction(int(weight), self.denominator)
+        return float(weight)
+
+    def random_outcomes(self, target_armor_class: int) -> list[RandomOutcome]:
+        index = min(max(target_armor_class - self.lowest_armor_class, 0), len(self.regular_hit_weights) - 1)
+        regular_hit_weight = self.regular_hit_weights[index].item()
+        return [
+            RandomOutcome(probability=self.probability(self.fumble_weight), name=EventSteps.FUMBLE),
+            RandomOutcome(probability=self.probability(self.crit_weight), name=EventSteps.CRIT),
+            RandomOutcome(probability=self.probability(regular_hit_weight), name=EventSteps.REGULAR_HIT),
+            RandomOutcome(probability=self.probability(self.regular_weight - regular_hit_weight), name=EventSteps.REGULAR_MISS),
+        ]
+
+
+# Tables are shared by every attack with the same roll, whatever the target
+ATTACK_OUTCOME_TABLES: LRUCache[tuple, AttackOutcomeTable] = LRUCache(maxsize=1024)
+
+
+def get_attack_outcome_table(advantage: bool, disadvantage: bool, reroll_fumbles: bool, roll_modifiers: DiceBag) -> AttackOutcomeTable:
+    # Advantage and disadvantage cancel each other
+    advantage, disadvantage = advantage and not disadvantage, disadvantage and not advantage
+    key = (get_probability_mode(), advantage, disadvantage, reroll_fumbles, roll_modifiers.key())
+    return ATTACK_OUTCOME_TABLES.get_or_compute(
+        key,
+        lambda: AttackOutcomeTable.compute(advantage, disadvantage, reroll_fumbles, roll_modifiers)
+    )
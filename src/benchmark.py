@@ -0,0 +1,81 @@
+import copy
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable
+
+from factory import (AbstractFactory, LightFootHalflingRogue, SimpleRogue,
+                     SimpleWarlock)
+from main import exhaust_tree
+from node_store import NodeStore
+from search import DepthFirstSearch
+from state import State
+from tree import TreeNode
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    nodes: int
+    elapsed: float # Seconds, measured while memory is traced
+    peak_memory: int # Bytes allocated at the peak, the starting state excluded
+
+    def peak_memory_per_node(self) -> float:
+        return self.peak_memory / self.nodes
+
+    def __str__(self) -> str:
+        return f'{self.name:<45} {self.nodes:>8} nodes {self.elapsed:>8.2f}s {self.peak_memory / 1e6:>9.2f}MB {self.peak_memory_per_node():>9.1f}B/node'
+
+
+def measure(name: str, state: State, search: Callable[[State], int]) -> BenchmarkResult:
+    """Run search (returning its node count) on a copy of the state, tracing its memory allocations"""
+    state = copy.deepcopy(state)
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        nodes = search(state)
+        elapsed = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return BenchmarkResult(name=name, nodes=nodes, elapsed=elapsed, peak_memory=peak_memory)
+
+
+def count_tree_nodes(node: TreeNode) -> int:
+    return 1 + sum(count_tree_nodes(child) for child in node.children)
+
+
+def tree_search(state: State) -> int:
+    return count_tree_nodes(exhaust_tree(state))
+
+
+def node_store_search(state: State) -> int:
+    return len(NodeStore.exhaust(state))
+
+
+def depth_first_search(state: State) -> int:
+    search = DepthFirstSearch()
+    search.find_best_strategy(state)
+    return search.statistics.nodes
+
+
+SEARCHES: dict[str, Callable[[State], int]] = {
+    'TreeNode tree': tree_search,
+    'NodeStore': node_store_search,
+    'DepthFirstSearch': depth_first_search,
+}
+
+
+def run_benchmarks(factories: list[AbstractFactory]) -> list[BenchmarkResult]:
+    results = []
+    for factory in factories:
+        state = factory.get_test_state()
+        for search_name, search in SEARCHES.items():
+            name = f'{factory.__class__.__name__}({factory.level}) {search_name}'
+            results.append(measure(name, state, search))
+    return results
+
+
+if __name__ == '__main__':
+    for result in run_benchmarks([SimpleRogue(2), SimpleWarlock(5), LightFootHalflingRogue(2)]):
+        print(result)
@@ -0,0 +1,162 @@
+import struct
+from dataclasses import dataclass, field
+from fractions import Fraction
+
+import numpy as np
+
+from character import Character
+from damage import Damage, DamageType
+from dices import Dice, DiceBag, DiceRoll
+from probability import RandomVariable, exact_weights_dtype
+
+DAMAGE_TYPES = list(DamageType)
+
+
+@dataclass
+class BinaryWriter:
+    """
+    Compact encoding of what changes during a fight
+
+    Integers are LEB128 varints (zigzag for signed ones), characters are encoded as their index in the state
+    """
+    creatures: list[Character]
+    buffer: bytearray = field(init=False, default_factory=bytearray)
+    creature_indexes: dict[str, int] = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.creature_indexes = {creature.name: index for index, creature in enumerate(self.creatures)}
+
+    def write_uint(self, value: int) -> None:
+        assert value >= 0
+        while value >= 0x80:
+            self.buffer.append(value & 0x7f | 0x80)
+            value >>= 7
+        self.buffer.append(value)
+
+    def write_int(self, value: int) -> None:
+        self.write_uint(value * 2 if value >= 0 else -value * 2 - 1)
+
+    def write_bool(self, value: bool) -> None:
+        self.buffer.append(value)
+
+    def write_bytes(self, value: bytes) -> None:
+        self.buffer += value
+
+    def write_fraction(self, value: Fraction) -> None:
+        self.write_int(value.numerator)
+        self.write_uint(value.denominator)
+
+    def write_float(self, value: float) -> None:
+        self.buffer += struct.pack('<d', value)
+
+    def write_random_variable(self, random_variable: RandomVariable) -> None:
+        """Exact weights are varints over the denominator, float ones are doubles"""
+        self.write_bool(random_variable.is_exact())
+        self.write_int(random_variable.offset)
+        self.write_uint(len(random_variable.weights))
+        if random_variable.is_exact():
+            self.write_uint(random_variable.denominator)
+            for weight in random_variable.weights.tolist():
+                self.write_uint(weight)
+        else:
+            for probability in random_variable.weights.tolist():
+                self.write_float(probability)
+
+    def write_character(self, character: Character | None) -> None:
+        """0 for None, index + 1 otherwise"""
+        self.write_uint(0 if character is None else self.creature_indexes[character.name] + 1)
+
+    def write_dice_bag(self, dice_bag: DiceBag) -> None:
+        fix, dice_rolls = dice_bag.key()
+        self.write_int(fix)
+        self.write_uint(len(dice_rolls))
+        for (faces, advantage, disadvantage, rerolling), count in dice_rolls:
+            self.write_uint(faces)
+            self.write_uint(advantage | disadvantage << 1)
+            self.write_uint(sum(1 << (value - 1) for value in rerolling))
+            self.write_int(count)
+
+    def write_damage(self, damage: Damage) -> None:
+        damage_key = damage.key()
+        self.write_uint(len(damage_key))
+        for damage_type, _ in damage_key:
+            self.write_uint(DAMAGE_TYPES.index(damage_type))
+            self.write_dice_bag(damage[damage_type])
+
+
+@dataclass
+class BinaryReader:
+    """Read what a BinaryWriter wrote, characters are looked up in the state being decoded"""
+    creatures: list[Character]
+    data: bytes
+    position: int = 0
+
+    def read_uint(self) -> int:
+        value = 0
+        shift = 0
+        while True:
+            if self.position >= len(self.data):
+                raise ValueError('Truncated data')
+            byte = self.data[self.position]
+            self.position += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def read_int(self) -> int:
+        value = self.read_uint()
+        return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+    def read_bool(self) -> bool:
+        return bool(self.read_uint())
+
+    def read_bytes(self, size: int) -> bytes:
+        if self.position + size > len(self.data):
+            raise ValueError('Truncated data')
+        self.position += size
+        return self.data[self.position - size:self.position]
+
+    def read_fraction(self) -> Fraction:
+        numerator = self.read_int()
+        return Fraction(numerator, self.read_uint())
+
+    def read_float(self) -> float:
+        value: float = struct.unpack('<d', self.read_bytes(8))[0]
+        return value
+
+    def read_random_variable(self) -> RandomVariable:
+        is_exact = self.read_bool()
+        offset = self.read_int()
+        size = self.read_uint()
+        if is_exact:
+            denominator = self.read_uint()
+            weights: np.ndarray = np.array([self.read_uint() for _ in range(size)], dtype=exact_weights_dtype(denominator))
+            return RandomVariable(offset, weights, denominator).freeze()
+        return RandomVariable(offset, np.array([self.read_float() for _ in range(size)])).freeze()
+
+    def read_character(self) -> Character | None:
+        index = self.read_uint()
+        return None if index == 0 else self.creatures[index - 1]
+
+    def read_dice_bag(self) -> DiceBag:
+        dice_bag = DiceBag(fix=self.read_int())
+        for _ in range(self.read_uint()):
+            dice = Dice(self.read_uint())
+            flags = self.read_uint()
+            rerolling_mask = self.read_uint()
+            dice_roll = DiceRoll(
+                dice,
+                advantage=bool(flags & 1),
+                disadvantage=bool(flags & 2),
+                rerolling=frozenset(value + 1 for value in range(rerolling_mask.bit_length()) if rerolling_mask >> value & 1),
+            )
+            dice_bag.dices[dice_roll] = self.read_int()
+        return dice_bag
+
+    def read_damage(self) -> Damage:
+        damage = Damage()
+        for _ in range(self.read_uint()):
+            damage_type = DAMAGE_TYPES[self.read_uint()]
+            damage[damage_type] = self.read_dice_bag()
+        return damage
@@ -0,0 +1,55 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Generic, Hashable, TypeVar
+
+KeyType = TypeVar('KeyType', bound=Hashable)
+ValueType = TypeVar('ValueType')
+
+
+@dataclass
+class CacheStatistics:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.
+
+
+@dataclass
+class LRUCache(Generic[KeyType, ValueType]):
+    """Bounded least recently used cache
+
+    Cached values are shared between all callers and must never be mutated
+    """
+    maxsize: int
+    entries: OrderedDict[KeyType, ValueType] = field(init=False, default_factory=OrderedDict)
+    statistics: CacheStatistics = field(init=False, default_factory=CacheStatistics)
+
+    def get_or_compute(self, key: KeyType, compute: Callable[[], ValueType]) -> ValueType:
+        if key in self.entries:
+            self.statistics.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.statistics.misses += 1
+        value = compute()
+        self.entries[key] = value
+        self.evict()
+        return value
+
+    def evict(self) -> None:
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.statistics.evictions += 1
+
+    def resize(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.evict()
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.statistics = CacheStatistics()
+
+    def __len__(self) -> int:
+        return len(self.entries)
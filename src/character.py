@@ -1,6 +1,8 @@
 
 import logging
 from dataclasses import dataclass, field
+from fractions import Fraction
+from typing import Hashable
 
 from ability import Ability, AbilitySkill
 from action_cost import ActionCost
@@ -10,7 +12,29 @@ from weapon import Weapon
 
 LOGGER = logging.getLogger('dnd')
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
+class DamageTaken:
+    """Last hit taken by a creature, linked to the previous ones so snapshots and strategies share them"""
+    damage: Damage
+    previous: 'DamageTaken | None' = None
+    damage_multipliers: tuple[Fraction, ...] | None = None # Of the creature, to explain the damage it took
+
+    def hits(self) -> list['DamageTaken']:
+        """Every hit taken up to this one, in order"""
+        hits = []
+        damage_taken: DamageTaken | None = self
+        while damage_taken is not None:
+            hits.append(damage_taken)
+            damage_taken = damage_taken.previous
+        return hits[::-1]
+
+    def __deepcopy__(self, memo: dict) -> 'DamageTaken':
+        # Hits are never modified, copies of a creature share them
+        return self
+
+
+@dataclass(slots=True)
 class Character:
     name: str
     ability_scores: dict[Ability, int]
@@ -18,14 +42,74 @@ class Character:
     level: int | None = None
     weapon: Weapon | None = None
     armor_class: int = 10
-    total_damage_taken: list[Damage] = field(default_factory=list)
+    # Running totals updated on each hit, so scoring does not go through every damage taken
+    expected_damage_taken: Fraction = field(init=False, default_factory=Fraction)
+    last_damage_taken: DamageTaken | None = field(init=False, default=None) # Hits are only kept for explanations
+    track_damage_distribution: bool = False
+    damage_distribution: RandomVariable | None = field(init=False, default=None) # Only when tracked
     current_spell_slots: list[int] = field(default_factory=lambda: [0]*8)
     maximum_spell_slots: list[int] = field(default_factory=lambda: [0]*8)
     skill_proficiencies: AbilitySkill = AbilitySkill(0)
     skill_expertise: AbilitySkill = AbilitySkill(0)
+    team: str | None = None # Creatures without a team are hostile to every other creature
+    # Resistances, immunities and vulnerabilities by damage type ordinal, multiplied damage is rounded down
+    damage_multipliers: tuple[Fraction, ...] | None = None
+
+    def __post_init__(self) -> None:
+        self.set_damage_taken([])
+
+    def is_hostile_to(self, other: 'Character') -> bool:
+        return other.name != self.name and (self.team is None or other.team != self.team)
 
     def takes_damage(self, damage: Damage) -> None:
-        self.total_damage_taken.append(damage)
+        self.last_damage_taken = DamageTaken(damage, self.last_damage_taken, self.damage_multipliers)
+        self.expected_damage_taken += damage.avg(self.damage_multipliers)
+        if self.damage_distribution is not None:
+            self.damage_distribution = (self.damage_distribution + damage.as_random_variable(self.damage_multipliers)).freeze()
+
+    def damage_taken(self) -> list[Damage]:
+        """Every hit taken, in order"""
+        return [] if self.last_damage_taken is None else [hit.damage for hit in self.last_damage_taken.hits()]
+
+    def set_damage_taken(self, damage_taken: list[Damage]) -> None:
+        """Replace damage taken and recompute running totals"""
+        self.expected_damage_taken = Fraction()
+        self.last_damage_taken = None
+        self.damage_distribution = RandomVariable.from_values([0]).freeze() if self.track_damage_distribution else None
+        for damage in damage_taken:
+            self.takes_damage(damage)
+
+    def fingerprint(self) -> Hashable:
+        """
+        Canonical key of what can change during a fight
+
+        Damage taken only matters through its running totals: hits do not change what can happen next
+        """
+        return (
+            self.name,
+            frozenset(self.action_availability.items()),
+            self.armor_class,
+            self.expected_damage_taken,
+            None if self.damage_distribution is None else tuple(self.damage_distribution.outcomes.items()),
+            tuple(self.current_spell_slots),
+        )
+
+    def save(self) -> object:
+        """Snapshot of what can change during a fight, hits and running totals are immutable"""
+        return (
+            dict(self.action_availability), self.expected_damage_taken,
+            self.last_damage_taken, self.damage_distribution, list(self.current_spell_slots),
+        )
+
+    def restore(self, snapshot: object) -> None:
+        assert isinstance(snapshot, tuple)
+        (
+            action_availability, self.expected_damage_taken,
+            self.last_damage_taken, self.damage_distribution, current_spell_slots,
+        ) = snapshot
+        # Snapshots can be restored several times, they must not become the live containers
+        self.action_availability = dict(action_availability)
+        self.current_spell_slots = list(current_spell_slots)
 
     def ability_modifier(self, ability: Ability) -> int:
         return (self.ability_scores[ability] - 10)//2
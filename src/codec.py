@@ -0,0 +1,169 @@
+from action import (AbilityContest, ActionEvent, ActionModule, Attack,
+                    ChoosingActionEvent, SavingThrow)
+from action_cost import ActionCost
+from binary import BinaryReader, BinaryWriter
+from character import Character, DamageTaken
+from event import EndOfTurnEvent, Event, EventSteps, StartOfTurnEvent
+from state import State
+
+MAGIC = b'DND'
+CODEC_VERSION = 2
+
+ACTION_COSTS = list(ActionCost)
+EVENT_STEPS = list(EventSteps)
+EVENT_TYPES: list[type[Event]] = [StartOfTurnEvent, EndOfTurnEvent, ChoosingActionEvent, ActionEvent]
+
+
+def encode_state(state: State, include_hits: bool = False) -> bytes:
+    """
+    Compact binary snapshot of everything an outcome can change
+
+    Only the progress of the fight is encoded: it is decoded against a state built the same way
+    (same creatures and modules, in the same order), like the one it was encoded from.
+    Possible outcomes are not encoded since they are recomputed from the current event
+    Like fingerprints, damage taken is encoded as running totals: hits, which only explain scores,
+    make the snapshot grow with the fight and are only included on demand
+    """
+    writer = BinaryWriter(state.creatures)
+    writer.write_bytes(MAGIC)
+    writer.write_uint(CODEC_VERSION)
+    writer.write_bool(include_hits)
+    writer.write_uint(len(state.creatures))
+    writer.write_uint(len(state.modules))
+    writer.write_uint(state.round_number)
+    writer.write_uint(state.current_turn_index)
+    for creature in state.creatures:
+        encode_creature(writer, creature, include_hits)
+    for module in state.modules:
+        module.encode(writer)
+    writer.write_uint(len(state.event_queue))
+    for event in state.event_queue:
+        encode_event(writer, state, event)
+    return bytes(writer.buffer)
+
+
+def decode_state(data: bytes, state: State) -> None:
+    """Set the progress of the fight of state to the encoded one, in place"""
+    reader = BinaryReader(state.creatures, data)
+    if reader.read_bytes(len(MAGIC)) != MAGIC:
+        raise ValueError('Not an encoded state')
+    if (version := reader.read_uint()) != CODEC_VERSION:
+        raise ValueError(f'Unsupported state codec version {version}, expected {CODEC_VERSION}')
+    include_hits = reader.read_bool()
+    if reader.read_uint() != len(state.creatures) or reader.read_uint() != len(state.modules):
+        raise ValueError('Encoded state does not match the creatures and modules of the state')
+    state.round_number = reader.read_uint()
+    state.current_turn_index = reader.read_uint()
+    for creature in state.creatures:
+        decode_creature(reader, creature, include_hits)
+    for module in state.modules:
+        module.decode(reader)
+    state.event_queue = [decode_event(reader, state) for _ in range(reader.read_uint())]
+    state.possibles_outcomes = None
+    if reader.position != len(data):
+        raise ValueError('Unexpected data after the encoded state')
+
+
+def encode_creature(writer: BinaryWriter, creature: Character, include_hits: bool) -> None:
+    # Action costs may be missing from availabilities, a mask of the present ones and a mask of the available ones
+    writer.write_uint(sum(1 << index for index, action_cost in enumerate(ACTION_COSTS) if action_cost in creature.action_availability))
+    writer.write_uint(sum(1 << index for index, action_cost in enumerate(ACTION_COSTS) if creature.action_availability.get(action_cost, False)))
+    writer.write_uint(len(creature.current_spell_slots))
+    for spell_slots in creature.current_spell_slots:
+        writer.write_uint(spell_slots)
+    writer.write_fraction(creature.expected_damage_taken)
+    if creature.damage_distribution is not None:
+        writer.write_random_variable(creature.damage_distribution)
+    if include_hits:
+        damage_taken = creature.damage_taken()
+        writer.write_uint(len(damage_taken))
+        for damage in damage_taken:
+            writer.write_damage(damage)
+
+
+def decode_creature(reader: BinaryReader, creature: Character, include_hits: bool) -> None:
+    present_action_costs = reader.read_uint()
+    available_action_costs = reader.read_uint()
+    creature.action_availability = {
+        action_cost: bool(available_action_costs >> index & 1)
+        for index, action_cost in enumerate(ACTION_COSTS) if present_action_costs >> index & 1
+    }
+    creature.current_spell_slots = [reader.read_uint() for _ in range(reader.read_uint())]
+    creature.expected_damage_taken = reader.read_fraction()
+    if creature.track_damage_distribution:
+        creature.damage_distribution = reader.read_random_variable()
+    # Without hits, the decoded creature starts a new chain of hits from its running totals
+    creature.last_damage_taken = None
+    if include_hits:
+        for _ in range(reader.read_uint()):
+            creature.last_damage_taken = DamageTaken(reader.read_damage(), creature.last_damage_taken, creature.damage_multipliers)
+
+
+def encode_event(writer: BinaryWriter, state: State, event: Event) -> None:
+    writer.write_uint(EVENT_TYPES.index(type(event)))
+    writer.write_character(event.origin_character)
+    writer.write_uint(event.event_step.ordinal)
+    writer.write_uint(event.event_processing_module_index)
+    match event:
+        case ChoosingActionEvent():
+            writer.write_uint(len(event.possible_actions))
+            for possible_action in event.possible_actions:
+                encode_event(writer, state, possible_action)
+        case ActionEvent():
+            writer.write_uint(action_module_index(state, event))
+            writer.write_character(event.target)
+            writer.write_uint(ACTION_COSTS.index(event.action_cost))
+            encode_roll(writer, event.attack)
+            encode_roll(writer, event.saving_throw)
+
+
+def decode_event(reader: BinaryReader, state: State) -> Event:
+    event_type = EVENT_TYPES[reader.read_uint()]
+    origin_character = reader.read_character()
+    assert origin_character is not None
+    event_step = EVENT_STEPS[reader.read_uint()]
+    event_processing_module_index = reader.read_uint()
+    event: Event
+    if event_type is ActionEvent:
+        action_module = state.modules[reader.read_uint()]
+        assert isinstance(action_module, ActionModule)
+        event = action_module.get_action_template().instantiate(reader.read_character())
+        assert isinstance(event, ActionEvent)
+        event.action_cost = ACTION_COSTS[reader.read_uint()]
+        decode_roll(reader, event.attack)
+        decode_roll(reader, event.saving_throw)
+    else:
+        event = event_type(origin_character=origin_character)
+        if isinstance(event, ChoosingActionEvent):
+            event.possible_actions = [decode_event(reader, state) for _ in range(reader.read_uint())]
+    event.event_step = event_step
+    event.event_processing_module_index = event_processing_module_index
+    return event
+
+
+def action_module_index(state: State, action_event: ActionEvent) -> int:
+    """Actions are decoded from the template of the module which built them"""
+    for module_index, module in enumerate(state.modules):
+        if type(module) is action_event.action_module and module.origin_character is not None \
+                and module.origin_character.name == action_event.origin_character.name:
+            return module_index
+    raise ValueError(f'No {action_event.action_module.__name__} module for {action_event.origin_character.name}')
+
+
+def encode_roll(writer: BinaryWriter, roll: Attack | SavingThrow | AbilityContest | None) -> None:
+    """What modules can change on the roll of an action being processed"""
+    if not isinstance(roll, (Attack, SavingThrow)):
+        return
+    writer.write_damage(roll.damage)
+    writer.write_uint(roll.advantage | roll.disadvantage << 1)
+    writer.write_dice_bag(roll.roll_modifiers)
+
+
+def decode_roll(reader: BinaryReader, roll: Attack | SavingThrow | AbilityContest | None) -> None:
+    if not isinstance(roll, (Attack, SavingThrow)):
+        return
+    roll.damage = reader.read_damage()
+    flags = reader.read_uint()
+    roll.advantage = bool(flags & 1)
+    roll.disadvantage = bool(flags & 2)
+    roll.roll_modifiers = reader.read_dice_bag()
@@ -1,12 +1,21 @@
-
-from collections import defaultdict
+import functools
+import math
 from enum import Enum, auto
 from fractions import Fraction
+from typing import Iterable
+
+import numpy as np
+import numpy.typing as npt
 
-from dices import Dice, DiceBag
+from cache import LRUCache
+from dices import Dice, DiceBag, DiceBagKey, DiceRoll
+from probability import (Moments, ProbabilityMode, RandomVariable,
+                         probability_mode, to_fraction)
 
 
 class DamageType(str, Enum):
+    ordinal: int # Position in the enum, index of damage arrays
+
     Fire = auto()
     Force = auto()
     Radiant = auto()
@@ -20,42 +29,215 @@ class DamageType(str, Enum):
     MagicalSlashing = auto()
     MagicalBludgeoning = auto()
 
+    def __init__(self, *args: object) -> None:
+        self.ordinal = len(self.__class__.__members__)
+
+
+DAMAGE_TYPES = list(DamageType)
+
+# Columns of dice count matrices, dice rolls are registered the first time they are used
+DICE_ROLLS: list[DiceRoll] = []
+DICE_ROLL_COLUMNS: dict[DiceRoll, int] = {}
+# Means of the columns as integers over a common denominator, so averages are integer dot products
+MEANS_DENOMINATOR = 1
+DICE_ROLL_MEAN_NUMERATORS = np.zeros(0, dtype=np.int64)
+DICE_ROLL_MAX_VALUES = np.zeros(0, dtype=np.int64)
+
+
+def dice_roll_column(dice_roll: DiceRoll) -> int:
+    global MEANS_DENOMINATOR, DICE_ROLL_MEAN_NUMERATORS, DICE_ROLL_MAX_VALUES
+    if dice_roll not in DICE_ROLL_COLUMNS:
+        DICE_ROLL_COLUMNS[dice_roll] = len(DICE_ROLLS)
+        DICE_ROLLS.append(dice_roll)
+        means = [registered_dice_roll.moments().mean for registered_dice_roll in DICE_ROLLS]
+        MEANS_DENOMINATOR = math.lcm(*(mean.denominator for mean in means))
+        DICE_ROLL_MEAN_NUMERATORS = np.array([int(mean * MEANS_DENOMINATOR) for mean in means], dtype=np.int64)
+        DICE_ROLL_MAX_VALUES = np.append(DICE_ROLL_MAX_VALUES, dice_roll.dice.value)
+    return DICE_ROLL_COLUMNS[dice_roll]
+
+
+def damage_from_dice_bags(dice_bags: Iterable[tuple[DamageType, DiceBag]]) -> 'Damage':
+    damage = Damage()
+    for damage_type, dice_bag in dice_bags:
+        damage[damage_type] = dice_bag
+    return damage
+
+
+def damage_multipliers(
+    resistances: Iterable[DamageType] = (),
+    immunities: Iterable[DamageType] = (),
+    vulnerabilities: Iterable[DamageType] = (),
+) -> tuple[Fraction, ...]:
+    """Factor applied to each damage type by ordinal, multiplied damage is rounded down"""
+    multipliers = [Fraction(1)] * len(DAMAGE_TYPES)
+    for damage_type in resistances:
+        multipliers[damage_type.ordinal] /= 2
+    for damage_type in vulnerabilities:
+        multipliers[damage_type.ordinal] *= 2
+    for damage_type in immunities:
+        multipliers[damage_type.ordinal] = Fraction(0)
+    return tuple(multipliers)
+
+
+@functools.cache
+def split_multipliers(multipliers: tuple[Fraction, ...]) -> tuple[npt.NDArray[np.int64], tuple[DamageType, ...]]:
+    """
+    Integral multipliers, applied to averages at once, and damage types with a fractional multiplier
+
+    Rounding down makes the average of a damage type with a fractional multiplier depend on its distribution
+    """
+    integral_multipliers = np.array([int(multiplier) if multiplier.denominator == 1 else 0 for multiplier in multipliers], dtype=np.int64)
+    integral_multipliers.flags.writeable = False
+    return integral_multipliers, tuple(damage_type for damage_type in DAMAGE_TYPES if multipliers[damage_type.ordinal].denominator != 1)
+
+
+# Averages of dice bags multiplied by a fraction and rounded down
+ROUNDED_DOWN_AVERAGES: LRUCache[tuple[DiceBagKey, Fraction], Fraction] = LRUCache(maxsize=4096)
+
+
+def rounded_down_average(dice_bag: DiceBag, multiplier: Fraction) -> Fraction:
+    def compute() -> Fraction:
+        with probability_mode(ProbabilityMode.EXACT):
+            return to_fraction(dice_bag.as_random_variable().scaled(multiplier).mean())
+    return ROUNDED_DOWN_AVERAGES.get_or_compute((dice_bag.key(), multiplier), compute)
+
+
+def repr_multiplied_dice_bag(dice_bag: DiceBag, multiplier: Fraction | None) -> str:
+    if multiplier is None or multiplier == 1:
+        return repr(dice_bag)
+    dice_bag_repr = f'({dice_bag})' if ' ' in repr(dice_bag) else repr(dice_bag)
+    if multiplier.denominator == 1:
+        return f'{dice_bag_repr} * {multiplier}'
+    return f'floor({dice_bag_repr} * {multiplier})'
+
 
 class Damage:
+    """
+    Dice bags of every damage type, stored as arrays indexed by damage type ordinal
+
+    Fixed parts are a vector and dice counts a matrix with one row per damage type
+    and one column per registered dice roll, narrower matrices are padded with zeros
+    """
+    __slots__ = ('fix', 'dice_counts')
+
     def __init__(self) -> None:
-        self.__damages: defaultdict[DamageType, DiceBag] = defaultdict(DiceBag)
+        self.fix = np.zeros(len(DAMAGE_TYPES), dtype=np.int64)
+        self.dice_counts = np.zeros((len(DAMAGE_TYPES), len(DICE_ROLLS)), dtype=np.int64)
+
+    @staticmethod
+    def from_arrays(fix: npt.NDArray[np.int64], dice_counts: npt.NDArray[np.int64]) -> 'Damage':
+        damage = Damage.__new__(Damage)
+        damage.fix = fix
+        damage.dice_counts = dice_counts
+        return damage
+
+    def padded_dice_counts(self, width: int) -> npt.NDArray[np.int64]:
+        if self.dice_counts.shape[1] == width:
+            return self.dice_counts
+        dice_counts = np.zeros((len(DAMAGE_TYPES), width), dtype=np.int64)
+        dice_counts[:, :self.dice_counts.shape[1]] = self.dice_counts
+        return dice_counts
+
+    def __reduce__(self) -> tuple[object, ...]:
+        # Columns depend on the order dice rolls were registered in this process, dice bags are sent instead
+        return damage_from_dice_bags, (tuple((damage_type, self[damage_type]) for damage_type in self.damage_types()),)
 
     def __add__(self, other: 'Damage') -> 'Damage':
-        result_damage_object = Damage()
-        damage_types = set(self.__damages.keys()).union(other.__damages.keys())
-        for damage_type in damage_types:
-            result_damage_object[damage_type] = self[damage_type] + other[damage_type]
-        return result_damage_object
+        width = max(self.dice_counts.shape[1], other.dice_counts.shape[1])
+        return Damage.from_arrays(self.fix + other.fix, self.padded_dice_counts(width) + other.padded_dice_counts(width))
 
     def __getitem__(self, key: DamageType) -> DiceBag:
-        return self.__damages[key]
+        return DiceBag(
+            fix=int(self.fix[key.ordinal]),
+            dices={DICE_ROLLS[column]: count for column, count in enumerate(self.dice_counts[key.ordinal].tolist()) if count != 0},
+        )
 
     def __setitem__(self, key: DamageType, item: DiceBag) -> None:
-        self.__damages[key] = item
+        """Arrays belong to their damage, they are modified in place"""
+        row = [0] * len(DICE_ROLLS)
+        for dice_roll, count in item.dices.items():
+            column = dice_roll_column(dice_roll)
+            if column >= len(row):
+                row.extend([0] * (column + 1 - len(row)))
+            row[column] += count
+        self.dice_counts = self.padded_dice_counts(len(row))
+        self.dice_counts[key.ordinal] = row
+        self.fix[key.ordinal] = item.fix
 
     def add(self, dmg_type: DamageType, value: DiceBag | Dice | int) -> 'Damage':
         self[dmg_type] += value
         return self
 
+    def damage_types(self) -> list[DamageType]:
+        """Damage types with a non empty dice bag"""
+        non_empty = (self.fix != 0) | self.dice_counts.any(axis=1)
+        return [damage_type for damage_type, is_non_empty in zip(DAMAGE_TYPES, non_empty.tolist()) if is_non_empty]
+
+    def key(self) -> tuple[tuple[DamageType, DiceBagKey], ...]:
+        """Canonical key of the damage, empty damage types are ignored"""
+        return tuple(sorted(
+            (damage_type, dice_bag_key) for damage_type in self.damage_types()
+            if (dice_bag_key := self[damage_type].key()) != (0, ())
+        ))
+
     def __repr__(self) -> str:
-        return f'{self.__class__.__name__}(' + ', '.join(f'{k.name}: {v}' for k,v in self.__damages.items()) + ')'
+        return self.repr_multiplied(None)
+
+    def repr_multiplied(self, multipliers: tuple[Fraction, ...] | None) -> str:
+        """Damage types with a multiplier other than 1 are shown multiplied, and rounded down if needed"""
+        return f'{self.__class__.__name__}(' + ', '.join(
+            f'{damage_type.name}: {repr_multiplied_dice_bag(self[damage_type], None if multipliers is None else multipliers[damage_type.ordinal])}'
+            for damage_type in self.damage_types()
+        ) + ')'
+
+    def copy(self) -> 'Damage':
+        return Damage.from_arrays(self.fix.copy(), self.dice_counts.copy())
 
     def as_critical(self) -> 'Damage':
-        result_damage = Damage()
-        for damage_type in self.__damages.keys():
-            result_damage[damage_type] = DiceBag(
-                dices={k: v * 2 for k, v in self[damage_type].dices.items()}, # Is it always true ? Barbarian brutal critical ?? what about negative dices ?
-                fix=self[damage_type].fix
-            )
-        return result_damage
-
-    def avg(self) -> Fraction:
+        # Is it always true ? Barbarian brutal critical ?? what about negative dices ?
+        return Damage.from_arrays(self.fix.copy(), self.dice_counts * 2)
+
+    def type_average_numerators(self) -> npt.NDArray[np.int64]:
+        """Average of each damage type, over MEANS_DENOMINATOR"""
+        return self.fix * MEANS_DENOMINATOR + self.dice_counts @ DICE_ROLL_MEAN_NUMERATORS[:self.dice_counts.shape[1]]
+
+    def avg(self, multipliers: tuple[Fraction, ...] | None = None) -> Fraction:
+        """Average damage, multipliers of the target are applied to each damage type and rounded down"""
+        if multipliers is None:
+            return Fraction(int(self.type_average_numerators().sum()), MEANS_DENOMINATOR)
+        integral_multipliers, rounded_down_damage_types = split_multipliers(multipliers)
+        average = Fraction(int(self.type_average_numerators() @ integral_multipliers), MEANS_DENOMINATOR)
+        for damage_type in rounded_down_damage_types:
+            if self.fix[damage_type.ordinal] != 0 or self.dice_counts[damage_type.ordinal].any():
+                average += rounded_down_average(self[damage_type], multipliers[damage_type.ordinal])
+        return average
+
+    def max_value(self) -> int:
+        """Highest possible roll, subtracted dices roll at least 1"""
+        dice_max_values = np.where(self.dice_counts > 0, DICE_ROLL_MAX_VALUES[:self.dice_counts.shape[1]], 1)
+        return int(self.fix.sum() + (self.dice_counts * dice_max_values).sum())
+
+    def as_random_variable(self, multipliers: tuple[Fraction, ...] | None = None) -> RandomVariable:
+        """Distribution of the total damage, every damage type included, multiplied damage types are rounded down"""
+        return sum(
+            (
+                self[damage_type].as_random_variable() if multipliers is None
+                else self[damage_type].as_random_variable().scaled(multipliers[damage_type.ordinal])
+                for damage_type in self.damage_types()
+            ),
+            start=RandomVariable.from_values([0])
+        ).freeze()
+
+    def sample(self, size: int, generator: np.random.Generator) -> npt.NDArray[np.int64]:
+        """Draw size rolls of the total damage, every damage type included"""
         return sum(
-            (dice_bag.avg() for dice_bag in self.__damages.values()),
-            start=Fraction()
+            (self[damage_type].sample(size, generator) for damage_type in self.damage_types()),
+            start=np.zeros(size, dtype=np.int64)
         )
+
+    def moments(self) -> Moments:
+        return sum(
+            (self[damage_type].moments() for damage_type in self.damage_types()),
+            start=Moments()
+        )
+
@@ -1,10 +1,25 @@
 
 
+from collections import Counter
 from dataclasses import dataclass, field
 from enum import Enum
 from fractions import Fraction
 
-from probability import RandomVariable, advantage_disadvantage
+import numpy as np
+import numpy.typing as npt
+
+from cache import LRUCache
+from probability import (Moments, ProbabilityMode, RandomVariable,
+                         advantage_disadvantage, get_probability_mode,
+                         probability_mode)
+
+DiceRollKey = tuple[int, bool, bool, tuple[int, ...]]
+DiceBagKey = tuple[int, tuple[tuple[DiceRollKey, int], ...]]
+
+# Distributions shared by every dice expression with the same canonical key (and probability mode)
+DISTRIBUTION_CACHE: LRUCache[tuple, RandomVariable] = LRUCache(maxsize=4096)
+# Moments of single dice rolls, there are only a few possible keys so it is not bounded
+DICE_ROLL_MOMENTS: dict[DiceRollKey, Moments] = {}
 
 
 class Dice(Enum):
@@ -16,26 +31,69 @@ class Dice(Enum):
     d20 = 20
 
     def as_random_variable(self) -> RandomVariable:
-        return RandomVariable.from_range(1, self.value)
+        return DiceRoll(self).as_random_variable()
 
     def __mul__(self, other: int) -> 'DiceBag':
         return DiceBag(
-            positive_dices=[DiceRoll(self) for _ in range(other)]
+            dices={DiceRoll(self): other}
         )
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class DiceRoll:
     dice: Dice
     advantage: bool = False
     disadvantage: bool = False
-    rerolling: set[int] = set()
+    rerolling: frozenset[int] = frozenset()
+
+    def __post_init__(self) -> None:
+        # Accept any collection of values so dice rolls stay hashable
+        object.__setattr__(self, 'rerolling', frozenset(self.rerolling))
+
+    def key(self) -> DiceRollKey:
+        """Canonical key: advantage and disadvantage cancel each other"""
+        return (
+            self.dice.value,
+            self.advantage and not self.disadvantage,
+            self.disadvantage and not self.advantage,
+            tuple(sorted(self.rerolling))
+        )
 
     def as_random_variable(self) -> RandomVariable:
-        rand_var = self.dice.as_random_variable()
+        return DISTRIBUTION_CACHE.get_or_compute(('DiceRoll', get_probability_mode(), self.key()), self.__compute_random_variable)
+
+    def sum_random_variable(self, count: int) -> RandomVariable:
+        """Distribution of the sum of count rolls of this dice"""
+        return DISTRIBUTION_CACHE.get_or_compute(
+            ('DiceRollSum', get_probability_mode(), self.key(), count),
+            lambda: self.as_random_variable().sum_of_copies(count).freeze()
+        )
+
+    def sample(self, size: int, generator: np.random.Generator, count: int = 1) -> npt.NDArray[np.int64]:
+        """Draw size sums of count rolls of this dice"""
+        distribution = self.as_random_variable()
+        return distribution.sample(size * count, generator).reshape(size, count).sum(axis=1)
+
+    def moments(self) -> Moments:
+        key = self.key()
+        if key not in DICE_ROLL_MOMENTS:
+            DICE_ROLL_MOMENTS[key] = self.__compute_moments()
+        return DICE_ROLL_MOMENTS[key]
+
+    def __compute_moments(self) -> Moments:
+        faces, advantage, disadvantage, rerolling = self.key()
+        if not advantage and not disadvantage and len(rerolling) == 0:
+            # Discrete uniform distribution on [1, faces]
+            return Moments(Fraction(faces + 1, 2), Fraction(faces ** 2 - 1, 12))
+        # A single dice roll has at most 20 values, computed once per key
+        with probability_mode(ProbabilityMode.EXACT):
+            return self.as_random_variable().moments()
+
+    def __compute_random_variable(self) -> RandomVariable:
+        rand_var = RandomVariable.from_range(1, self.dice.value)
         rand_var.reroll_on_values(self.rerolling)
         rand_var = advantage_disadvantage(rand_var, self.advantage, self.disadvantage)
-        return rand_var
+        return rand_var.freeze()
 
     def __repr__(self) -> str:
         end = ''
@@ -46,16 +104,49 @@ class DiceRoll:
         return f'{self.dice.name}{end}'
 
 
-@dataclass
+@dataclass(slots=True)
 class DiceBag:
     fix: int = 0
-    positive_dices: list[DiceRoll] = field(default_factory=list)
-    negative_dices: list[DiceRoll] = field(default_factory=list)
+    dices: dict[DiceRoll, int] = field(default_factory=dict) # Dice roll -> count, negative counts are subtracted
 
     def avg(self) -> Fraction:
-        return sum(
-            (value * probability for value, probability in self.as_random_variable().outcomes.items()),
-            start=Fraction()
+        return self.moments().mean
+
+    def moments(self) -> Moments:
+        """Return mean and variance in O(number of distinct dices) without computing the distribution"""
+        result = Moments(Fraction(self.fix))
+        for dice_roll, count in self.dices.items():
+            if count > 0:
+                result += dice_roll.moments() * count
+            else:
+                result -= dice_roll.moments() * -count
+        return result
+
+    def max_value(self) -> int:
+        """Highest possible roll, subtracted dices roll at least 1"""
+        return self.fix + sum(
+            count * dice_roll.dice.value if count > 0 else count
+            for dice_roll, count in self.dices.items()
+        )
+
+    def sample(self, size: int, generator: np.random.Generator) -> npt.NDArray[np.int64]:
+        """Draw size rolls of the whole bag, dice by dice, without building its distribution"""
+        samples = np.full(size, self.fix, dtype=np.int64)
+        for dice_roll, count in self.dices.items():
+            if count > 0:
+                samples += dice_roll.sample(size, generator, count)
+            else:
+                samples -= dice_roll.sample(size, generator, -count)
+        return samples
+
+    def key(self) -> DiceBagKey:
+        """Canonical key of the dice expression"""
+        counts: Counter[DiceRollKey] = Counter()
+        for dice_roll, count in self.dices.items():
+            counts[dice_roll.key()] += count
+        return (
+            self.fix,
+            tuple(sorted((dice_roll_key, count) for dice_roll_key, count in counts.items() if count != 0)),
         )
 
     def as_random_variable(self) -> RandomVariable:
@@ -63,19 +154,23 @@ class DiceBag:
         TODO: some variables cannot be negatives and must be fixed
         Conditional rolling ?? Just like critical and fumble ?
         """
+        return DISTRIBUTION_CACHE.get_or_compute(('DiceBag', get_probability_mode(), self.key()), self.__compute_random_variable)
+
+    def __compute_random_variable(self) -> RandomVariable:
         result = RandomVariable.from_values([self.fix])
-        for dice_roll in self.positive_dices:
-            result = result + dice_roll.as_random_variable()
-        for dice_roll in self.negative_dices:
-            result = result - dice_roll.as_random_variable()
-        return result
+        for dice_roll, count in self.dices.items():
+            if count > 0:
+                result = result + dice_roll.sum_random_variable(count)
+            elif count < 0:
+                result = result - dice_roll.sum_random_variable(-count)
+        return result.freeze()
 
     @staticmethod
     def cast_to_dice_bag(obj: int | Dice | DiceRoll) -> 'DiceBag':
         match obj:
             case Dice():
                 return DiceBag(
-                    positive_dices=[DiceRoll(obj)]
+                    dices={DiceRoll(obj): 1}
                 )
             case int():
                 return DiceBag(
@@ -83,42 +178,38 @@ class DiceBag:
                 )
             case DiceRoll():
                 return DiceBag(
-                    positive_dices=[obj]
+                    dices={obj: 1}
                 )
             case _:
                 raise TypeError(f'object should be either a int or a Dices not a {type(obj)}')
 
+    def __combine(self, other: 'DiceBag', sign: int) -> 'DiceBag':
+        dices = dict(self.dices)
+        for dice_roll, count in other.dices.items():
+            dices[dice_roll] = dices.get(dice_roll, 0) + sign * count
+            if dices[dice_roll] == 0:
+                del dices[dice_roll]
+        return DiceBag(fix=self.fix + sign * other.fix, dices=dices)
+
     def __add__(self, other: 'DiceBag | int | Dice | DiceRoll') -> 'DiceBag':
         if not isinstance(other, DiceBag):
             other = DiceBag.cast_to_dice_bag(other)
-        res = DiceBag(fix=self.fix + other.fix)
-        res.positive_dices = self.positive_dices + other.positive_dices
-        res.negative_dices = self.negative_dices + other.negative_dices
-        return res
+        return self.__combine(other, 1)
 
-    def __sub__(self, other: 'DiceBag | int | Dice') -> 'DiceBag':
+    def __sub__(self, other: 'DiceBag | int | Dice | DiceRoll') -> 'DiceBag':
         if not isinstance(other, DiceBag):
             other = DiceBag.cast_to_dice_bag(other)
-        res = DiceBag(fix=self.fix - other.fix)
-        res.positive_dices = self.positive_dices + other.negative_dices
-        res.negative_dices = self.negative_dices + other.positive_dices
-        return res
+        return self.__combine(other, -1)
 
     def __repr__(self) -> str:
         res = []
-        blabla = {}
-        for dice_roll in self.positive_dices:
-            res.append('+ ')
-            res.append()
-        for dices in [self.positive_dices, self.negative_dices]
-        for (is_positive, dice), count in self.dices.items():
-            sign = '+' if is_positive else '-'
-            res.append(sign)
-            res.append(f'{count}{dice.name}')
+        for dice_roll, count in self.dices.items():
+            res.append('+' if count > 0 else '-')
+            res.append(f'{abs(count) if abs(count) != 1 else ""}{dice_roll}')
         if self.fix != 0:
             sign = '+' if self.fix > 0 else '-'
             res.append(sign)
-            res.append(f'{self.fix}')
+            res.append(f'{abs(self.fix)}')
         if len(res) > 0 and res[0] == '+':
             res.pop(0)
         return ' '.join(res)
@@ -1,24 +1,37 @@
 from abc import ABC
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from enum import Enum, auto
-from fractions import Fraction
+from typing import Iterator
 
 from character import Character
+from fingerprint import Fingerprint, fingerprint_fields
+from probability import Probability
 
 
-@dataclass
+@dataclass(slots=True)
 class RandomOutcome:
     name: 'EventSteps'
-    probability: Fraction
+    probability: Probability
 
 
-@dataclass
+@dataclass(slots=True)
 class Choice:
-    name: str
+    """Event that can be chosen, it is only instantiated once it is chosen"""
     choice: 'Event'
+    target: Character | None = None
+
+    @property
+    def name(self) -> str:
+        return self.choice.choice_name(self.target)
+
+    def instantiate(self) -> 'Event':
+        return self.choice.instantiate(self.target)
 
 
 class EventSteps(str, Enum):
+    ordinal: int # Position in the enum, index of transition tables
+
     BEFORE_EVENT = auto() # Counter spell
 
     BEFORE_ATTACK = auto()
@@ -38,8 +51,41 @@ class EventSteps(str, Enum):
     AFTER_EVENT = auto() # any uses ??? Riposte, Sentinel ?
     END = auto()
 
+    def __init__(self, *args: object) -> None:
+        self.ordinal = len(self.__class__.__members__)
+
+
+# Step transitions are compiled in tables indexed by step ordinal, checking them is a debug mode
+_transition_validation = False
+
+
+def get_transition_validation() -> bool:
+    return _transition_validation
+
+
+def set_transition_validation(enabled: bool) -> None:
+    global _transition_validation
+    _transition_validation = enabled
+
+
+@contextmanager
+def transition_validation() -> Iterator[None]:
+    """Check every step transition against the workflow definitions (like in tests)"""
+    previous_validation = get_transition_validation()
+    set_transition_validation(True)
+    try:
+        yield
+    finally:
+        set_transition_validation(previous_validation)
 
-@dataclass(kw_only=True)
+
+def compile_transitions(next_steps: dict[EventSteps, EventSteps]) -> tuple[EventSteps | None, ...]:
+    """Next step of every step by ordinal, None when there is none"""
+    return tuple(next_steps.get(step) for step in EventSteps)
+
+
+# Events, outcomes and characters are slotted: a tree holds a copy of them for every node
+@dataclass(kw_only=True, slots=True)
 class Event(ABC):
     origin_character: Character
     event_processing_module_index: int = field(init=False, default=0)
@@ -48,18 +94,42 @@ class Event(ABC):
     def get_possible_outcomes(self) -> list[RandomOutcome] | None:
         return None
 
+    def fingerprint(self) -> Fingerprint:
+        """Canonical key of the event progress, characters are identified by their name"""
+        return fingerprint_fields(self)
+
+    def save(self) -> object:
+        """Snapshot of the event progress, restored when a search rolls back an outcome"""
+        return self.event_step, self.event_processing_module_index
+
+    def restore(self, snapshot: object) -> None:
+        assert isinstance(snapshot, tuple)
+        self.event_step, self.event_processing_module_index = snapshot
+
+    def choice_name(self, target: Character | None) -> str:
+        return self.__class__.__name__
+
+    def instantiate(self, target: Character | None) -> 'Event':
+        """Event processed when this event is chosen"""
+        return self
+
     def do_outcome(self, outcome: RandomOutcome | Choice | None) -> None:
-        next_step_dict = {
-            EventSteps.BEFORE_EVENT: EventSteps.AFTER_EVENT,
-            EventSteps.AFTER_EVENT: EventSteps.END
-        }
-        self.event_step = next_step_dict[self.event_step]
+        next_step = EVENT_TRANSITIONS[self.event_step.ordinal]
+        if next_step is None:
+            raise ValueError(f'There is no next step after {self.event_step} for {self.__class__.__name__}')
+        self.event_step = next_step
         self.event_processing_module_index = 0
 
 
+EVENT_TRANSITIONS = compile_transitions({
+    EventSteps.BEFORE_EVENT: EventSteps.AFTER_EVENT,
+    EventSteps.AFTER_EVENT: EventSteps.END
+})
+
+
 class EndOfTurnEvent(Event):
-    pass
+    __slots__ = ()
 
 
 class StartOfTurnEvent(Event):
-    pass
+    __slots__ = ()
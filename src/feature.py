@@ -4,18 +4,22 @@ from action import ChoosingActionEvent
 from action_cost import ActionCost
 from event import (Choice, EndOfTurnEvent, Event, EventSteps, RandomOutcome,
                    StartOfTurnEvent)
-from module import Module
+from module import Module, Subscription
 
 # Note: Reaction Spells like CounterSpell / Absorb Element / Shield are features
 
 
 class StartOfTurnFeature(Module):
+    subscriptions = (Subscription((StartOfTurnEvent,), frozenset({EventSteps.BEFORE_EVENT})),)
+
     def on_event(self, event: Event, chosen_outcome: RandomOutcome | Choice | None) -> Event | None:
         if isinstance(event, StartOfTurnEvent) and event.event_step is EventSteps.BEFORE_EVENT:
             event.origin_character.action_availability = {action_cost: True for action_cost in ActionCost if action_cost is not ActionCost.NONE}
         return None
 
 class EndOfTurnAction(Module):
+    subscriptions = (Subscription((ChoosingActionEvent,), frozenset({EventSteps.AFTER_EVENT})),)
+
     def on_event(self, event: Event, chosen_outcome: RandomOutcome | Choice | None) -> Event | None:
         if not isinstance(event, ChoosingActionEvent) or event.event_step != EventSteps.AFTER_EVENT:
             return None
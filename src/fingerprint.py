@@ -0,0 +1,45 @@
+from dataclasses import fields, is_dataclass
+from enum import Enum
+from typing import Hashable
+
+from character import Character
+from damage import Damage
+from dices import DiceBag, DiceRoll
+
+# Fingerprints are only meant to compare states reachable from the same starting state:
+# characters referenced by events or modules are identified by their name
+Fingerprint = Hashable
+
+
+def fingerprint_value(value: object) -> Fingerprint:
+    """Canonical hashable representation of a value held by an event or a module"""
+    match value:
+        case Character():
+            return value.name
+        case Damage() | DiceBag() | DiceRoll():
+            return value.key()
+        case None | bool() | int() | float() | str() | Enum():
+            return value
+        case type():
+            return value.__qualname__
+        case list() | tuple():
+            return tuple(fingerprint_value(item) for item in value)
+        case set() | frozenset():
+            return frozenset(fingerprint_value(item) for item in value)
+        case dict():
+            return frozenset((fingerprint_value(key), fingerprint_value(item)) for key, item in value.items())
+        case _ if is_dataclass(value):
+            return fingerprint_fields(value)
+        case _ if callable(value):
+            # Callbacks are bound to modules, their state is part of the modules fingerprints
+            return None
+    raise TypeError(f'Cannot fingerprint a {type(value)}')
+
+
+def fingerprint_fields(obj: object) -> Fingerprint:
+    assert is_dataclass(obj)
+    return (
+        obj.__class__.__qualname__,
+        # Fields excluded from comparison are caches, not state
+        tuple(fingerprint_value(getattr(obj, obj_field.name)) for obj_field in fields(obj) if obj_field.compare),
+    )
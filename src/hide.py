@@ -4,12 +4,17 @@ from dataclasses import dataclass, field
 from ability import AbilitySkill
 from action import AbilityContest, ActionEvent, ActionModule
 from action_cost import ActionCost
+from binary import BinaryReader, BinaryWriter
 from character import Character
 from event import Choice, Event, EventSteps, RandomOutcome
+from module import Subscription
 
 
 @dataclass(kw_only=True)
 class HideAction(ActionModule):
+    subscriptions = ActionModule.subscriptions + (
+        Subscription((ActionEvent,), frozenset({EventSteps.CONTEST_SUCCESS, EventSteps.BEFORE_ATTACK}), own_events_only=True),
+    )
     action_cost: ActionCost
     hided_from: list[Character] = field(init=False, default_factory=list)
 
@@ -28,6 +33,25 @@ class HideAction(ActionModule):
             action_module=self.__class__,
         )
 
+    def save(self) -> object:
+        return list(self.hided_from)
+
+    def restore(self, snapshot: object) -> None:
+        assert isinstance(snapshot, list)
+        self.hided_from = list(snapshot)
+
+    def encode(self, writer: BinaryWriter) -> None:
+        writer.write_uint(len(self.hided_from))
+        for character in self.hided_from:
+            writer.write_character(character)
+
+    def decode(self, reader: BinaryReader) -> None:
+        self.hided_from = []
+        for _ in range(reader.read_uint()):
+            character = reader.read_character()
+            assert character is not None
+            self.hided_from.append(character)
+
     def on_event(self, event: Event, chosen_outcome: RandomOutcome | Choice | None) -> Event | None:
         assert self.origin_character is not None
 
@@ -0,0 +1,92 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+from event import Event
+from module import Module
+
+
+@dataclass
+class TimingStatistics:
+    calls: int = 0
+    total_time: float = 0. # Seconds
+
+
+@dataclass
+class Recorder:
+    """Where time goes during a search: modules on_event calls, event steps and expanded nodes"""
+    module_timings: defaultdict[str, TimingStatistics] = field(default_factory=lambda: defaultdict(TimingStatistics))
+    event_steps: Counter[tuple[str, str]] = field(default_factory=Counter) # (event type, step) -> processed count
+    nodes_per_depth: Counter[int] = field(default_factory=Counter)
+
+    def record_module_event(self, module: Module, elapsed: float) -> None:
+        origin_name = module.origin_character.name if module.origin_character is not None else None
+        timing = self.module_timings[f'{module.__class__.__name__} ({origin_name})']
+        timing.calls += 1
+        timing.total_time += elapsed
+
+    def record_event_step(self, event: Event) -> None:
+        self.event_steps[(event.__class__.__name__, event.event_step.name)] += 1
+
+    def record_node(self, depth: int) -> None:
+        self.nodes_per_depth[depth] += 1
+
+    def add(self, other: 'Recorder') -> None:
+        """Merge what another recorder saw, like the ones of parallel search workers"""
+        for name, timing in other.module_timings.items():
+            self.module_timings[name].calls += timing.calls
+            self.module_timings[name].total_time += timing.total_time
+        self.event_steps.update(other.event_steps)
+        self.nodes_per_depth.update(other.nodes_per_depth)
+
+    def report(self) -> str:
+        lines = ['Modules (calls, total time, time per call):']
+        for name, timing in sorted(self.module_timings.items(), key=lambda item: -item[1].total_time):
+            lines.append(f'  {name}: {timing.calls}, {timing.total_time:.4f}s, {1e6 * timing.total_time / timing.calls:.2f}us')
+        lines.append('Event steps:')
+        for (event_type, step), count in self.event_steps.most_common():
+            lines.append(f'  {event_type} {step}: {count}')
+        lines.append('Nodes per depth:')
+        for depth, count in sorted(self.nodes_per_depth.items()):
+            lines.append(f'  {depth}: {count}')
+        return '\n'.join(lines)
+
+    def to_dict(self) -> dict[str, Any]:
+        """JSON serializable export"""
+        return {
+            'modules': {
+                name: {'calls': timing.calls, 'total_time': timing.total_time}
+                for name, timing in self.module_timings.items()
+            },
+            'event_steps': [
+                {'event_type': event_type, 'step': step, 'count': count}
+                for (event_type, step), count in self.event_steps.items()
+            ],
+            'nodes_per_depth': {str(depth): count for depth, count in sorted(self.nodes_per_depth.items())},
+        }
+
+
+# Hooks are a single None check when no recorder is active
+_recorder: Recorder | None = None
+
+
+def get_recorder() -> Recorder | None:
+    return _recorder
+
+
+def set_recorder(recorder: Recorder | None) -> None:
+    global _recorder
+    _recorder = recorder
+
+
+@contextmanager
+def recording() -> Iterator[Recorder]:
+    """Record everything happening in the block (like a whole tree search)"""
+    previous_recorder = get_recorder()
+    recorder = Recorder()
+    set_recorder(recorder)
+    try:
+        yield recorder
+    finally:
+        set_recorder(previous_recorder)
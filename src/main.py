@@ -1,9 +1,11 @@
 import copy
+from collections import deque
 
 import utils
 from action import ActionEvent
 from event import Choice, RandomOutcome
 from factory import SimpleRogue
+from instrumentation import get_recorder
 from state import State
 from tree import TreeNode, find_best_strategy
 
@@ -14,7 +16,7 @@ def test_interactive_arena() -> None:
     while True:
         possibles_outcomes = state.forward_until_branch()
         assert possibles_outcomes is not None
-        print(f'Total damage taken by the punching ball is: {state.creatures[0].total_damage_taken}')
+        print(f'Total damage taken by the punching ball is: {state.creatures[0].damage_taken()}')
         print('Possible outcomes are:')
         for i, outcome in enumerate(possibles_outcomes):
             print(f'{i}: {display_outcome(outcome)}')
@@ -28,17 +30,19 @@ def test_interactive_arena() -> None:
 def display_outcome(outcome: RandomOutcome | Choice) -> str:
     if isinstance(outcome, Choice):
         if isinstance(outcome.choice, ActionEvent):
-            assert outcome.choice.target is not None
-            return f'{outcome.choice.action_module.__name__} -> {outcome.choice.target.name}'
+            assert outcome.target is not None
+            return f'{outcome.choice.action_module.__name__} -> {outcome.target.name}'
         return outcome.choice.__class__.__name__
     return str(outcome)
 
 
 def exhaust_tree(state: State) -> TreeNode:
     root_node = TreeNode(state)
-    to_do = [root_node]
+    to_do = deque([(root_node, 0)])
     while len(to_do) > 0:
-        node = to_do.pop(0)
+        node, depth = to_do.popleft()
+        if (recorder := get_recorder()) is not None:
+            recorder.record_node(depth)
         possible_outcomes = node.state.forward_until_branch(absolute_round_limit=1)
         if possible_outcomes is None:
             continue # reached maximum rounds
@@ -51,7 +55,7 @@ def exhaust_tree(state: State) -> TreeNode:
                 parent=node
             )
             node.children.append(child_node)
-            to_do.append(child_node)
+            to_do.append((child_node, depth + 1))
     return root_node
 
 
@@ -59,7 +63,7 @@ def test_tree() -> None:
     state = SimpleRogue(2).get_test_state()
     root_node = exhaust_tree(state)
     root_node.print_full_tree()
-    best_strategy = find_best_strategy(root_node)
+    best_strategy = find_best_strategy(root_node, explain=True)
     print(best_strategy)
     print('\n\n')
     print(best_strategy.choices)
@@ -68,7 +72,9 @@ def test_tree() -> None:
     [username] = usernames
     score_value = best_strategy.scores[username].value
     print('Score =', round(float(score_value), 4))
-    print(utils.repr_history(best_strategy.scores[username].history))
+    history = best_strategy.scores[username].history
+    assert history is not None
+    print(utils.repr_history(history))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,189 @@
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+
+from action import ActionEvent
+from event import Choice, RandomOutcome
+from instrumentation import get_recorder
+from sampling import random_generator
+from state import State
+from tree import leaf_strategy
+
+# Index of the choice to make during a rollout
+RolloutPolicy = Callable[[State, list[Choice], np.random.Generator], int]
+
+
+def random_rollout_policy(state: State, choices: list[Choice], generator: np.random.Generator) -> int:
+    return int(generator.integers(len(choices)))
+
+
+def action_first_rollout_policy(state: State, choices: list[Choice], generator: np.random.Generator) -> int:
+    """Pick a random action while there are some, ending the turn only when nothing else is possible"""
+    action_indexes = [index for index, choice in enumerate(choices) if isinstance(choice.choice, ActionEvent)]
+    if len(action_indexes) == 0:
+        return random_rollout_policy(state, choices, generator)
+    return action_indexes[int(generator.integers(len(action_indexes)))]
+
+
+@dataclass(eq=False)
+class MCTSNode:
+    outcome: Choice | RandomOutcome | None = None
+    deciding_creature_id: str | None = None # Only for choice nodes
+    children: list['MCTSNode'] | None = None # None until expanded, empty for leaves
+    visits: int = 0
+    total_scores: dict[str, float] = field(default_factory=dict)
+
+    def mean_score(self, creature_id: str) -> float:
+        return self.total_scores.get(creature_id, 0.) / self.visits if self.visits > 0 else 0.
+
+    def outcome_name(self) -> str:
+        match self.outcome:
+            case Choice():
+                return self.outcome.name
+            case RandomOutcome():
+                return self.outcome.name.name
+        return 'root'
+
+    def action_values(self) -> dict[str, float]:
+        """Mean score of each choice for the deciding creature"""
+        assert self.deciding_creature_id is not None and self.children is not None, 'Not an expanded choice node'
+        return {child.outcome_name(): child.mean_score(self.deciding_creature_id) for child in self.children}
+
+    def visit_counts(self) -> dict[str, int]:
+        assert self.children is not None
+        return {child.outcome_name(): child.visits for child in self.children}
+
+    def most_visited_child(self) -> 'MCTSNode':
+        assert self.children
+        return max(self.children, key=lambda child: child.visits)
+
+
+@dataclass
+class MCTSResult:
+    root: MCTSNode
+    iterations: int
+    elapsed: float # Seconds
+
+    def best_choices(self) -> list[str]:
+        """Most visited choices, following the most visited random outcomes"""
+        choices = []
+        node = self.root
+        while node.children:
+            node = node.most_visited_child()
+            if isinstance(node.outcome, Choice):
+                choices.append(node.outcome.name)
+        return choices
+
+
+@dataclass
+class MonteCarloTreeSearch:
+    """
+    Approximate search for fights too big to be exhausted
+
+    Choices are selected with UCT on the deciding creature score, random outcomes are sampled
+    with their probabilities and new nodes are scored by a rollout until the round limit
+    A single state is walked in place and rolled back after each iteration
+    """
+    absolute_round_limit: int = 1
+    iterations: int | None = 1000
+    time_budget: float | None = None # Seconds
+    exploration: float = math.sqrt(2) # Applied to scores normalized by the best score seen
+    rollout_policy: RolloutPolicy = random_rollout_policy
+    seed: int | None = None
+    generator: np.random.Generator = field(init=False)
+    max_score: float = field(init=False, default=0.)
+
+    def __post_init__(self) -> None:
+        if self.iterations is None and self.time_budget is None:
+            raise ValueError('At least one of iterations and time budget must be given')
+        self.generator = random_generator(self.seed)
+
+    def search(self, state: State) -> MCTSResult:
+        start = time.perf_counter()
+        root = MCTSNode()
+        snapshot = state.save()
+        iterations = 0
+        while (self.iterations is None or iterations < self.iterations) and \
+                (self.time_budget is None or time.perf_counter() - start < self.time_budget):
+            self.iterate(state, root)
+            state.restore(snapshot)
+            iterations += 1
+        return MCTSResult(root=root, iterations=iterations, elapsed=time.perf_counter() - start)
+
+    def iterate(self, state: State, root: MCTSNode) -> None:
+        path = [root]
+        node = root
+        while True:
+            possible_outcomes = state.forward_until_branch(absolute_round_limit=self.absolute_round_limit)
+            if possible_outcomes is None:
+                node.children = []
+                scores = self.leaf_scores(state)
+                break
+            if node.children is None:
+                self.expand(state, node, possible_outcomes)
+                node = self.select_and_apply(state, node)
+                path.append(node)
+                scores = self.rollout(state)
+                break
+            node = self.select_and_apply(state, node)
+            path.append(node)
+        # Tree nodes are recorded on every visit, rollouts are not
+        recorder = get_recorder()
+        for depth, visited_node in enumerate(path):
+            if recorder is not None:
+                recorder.record_node(depth)
+            visited_node.visits += 1
+            for creature_id, score in scores.items():
+                visited_node.total_scores[creature_id] = visited_node.total_scores.get(creature_id, 0.) + score
+
+    def expand(self, state: State, node: MCTSNode, possible_outcomes: list[Choice] | list[RandomOutcome]) -> None:
+        node.children = [MCTSNode(outcome=outcome) for outcome in possible_outcomes]
+        if all(isinstance(outcome, Choice) for outcome in possible_outcomes):
+            node.deciding_creature_id = state.current_turn_creature().name
+        elif not all(isinstance(outcome, RandomOutcome) for outcome in possible_outcomes):
+            raise ValueError('Unexpected: not uniform type of outcomes')
+
+    def select_and_apply(self, state: State, node: MCTSNode) -> MCTSNode:
+        assert node.children is not None
+        if node.deciding_creature_id is None:
+            index = self.sample_random_outcome([child.outcome for child in node.children])
+        else:
+            index = self.select_choice(node)
+        state.do_outcome(index)
+        return node.children[index]
+
+    def select_choice(self, node: MCTSNode) -> int:
+        """UCT, unvisited choices are tried first in order"""
+        assert node.children is not None and node.deciding_creature_id is not None
+        for index, child in enumerate(node.children):
+            if child.visits == 0:
+                return index
+        scale = self.max_score if self.max_score > 0 else 1.
+        log_visits = math.log(node.visits)
+        uct_values = [
+            child.mean_score(node.deciding_creature_id) / scale + self.exploration * math.sqrt(log_visits / child.visits)
+            for child in node.children
+        ]
+        return int(np.argmax(uct_values))
+
+    def sample_random_outcome(self, random_outcomes: list[Choice | RandomOutcome | None]) -> int:
+        probabilities = np.array([float(outcome.probability) for outcome in random_outcomes if isinstance(outcome, RandomOutcome)])
+        assert len(probabilities) == len(random_outcomes)
+        return int(self.generator.choice(len(probabilities), p=probabilities / probabilities.sum()))
+
+    def rollout(self, state: State) -> dict[str, float]:
+        while (possible_outcomes := state.forward_until_branch(absolute_round_limit=self.absolute_round_limit)) is not None:
+            if all(isinstance(outcome, Choice) for outcome in possible_outcomes):
+                index = self.rollout_policy(state, [outcome for outcome in possible_outcomes if isinstance(outcome, Choice)], self.generator)
+            else:
+                index = self.sample_random_outcome(list(possible_outcomes))
+            state.do_outcome(index)
+        return self.leaf_scores(state)
+
+    def leaf_scores(self, state: State) -> dict[str, float]:
+        scores = {creature_id: float(score.value) for creature_id, score in leaf_strategy(state).scores.items()}
+        self.max_score = max(self.max_score, *scores.values())
+        return scores
@@ -1,23 +1,71 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Optional
+from typing import ClassVar, Optional
 
+from binary import BinaryReader, BinaryWriter
 from character import Character
-from event import Choice, Event, RandomOutcome
+from event import Choice, Event, EventSteps, RandomOutcome
+from fingerprint import Fingerprint, fingerprint_fields
+
+
+@dataclass(frozen=True)
+class Subscription:
+    """Events a module must be dispatched, anything else is skipped by the state"""
+    event_types: tuple[type[Event], ...] = (Event,)
+    steps: frozenset[EventSteps] | None = None # None for every step
+    own_events_only: bool = False # Only events originating from the module character
+
+    def matches(self, event_type: type[Event], event_step: EventSteps) -> bool:
+        return issubclass(event_type, self.event_types) and (self.steps is None or event_step in self.steps)
 
 
 @dataclass(kw_only=True)
 class Module(ABC):
     """
     Abstract class for all event driven system like Features or Actions
+
+    Modules are only dispatched events matching one of their subscriptions,
+    by default they receive every event
     """
+    subscriptions: ClassVar[tuple[Subscription, ...]] = (Subscription(),)
     origin_character: Optional[Character] = None
     target_character: Optional[Character] = None
     to_delete: bool = False
 
+    def is_subscribed(self, event_type: type[Event], event_step: EventSteps, origin_character_name: str) -> bool:
+        return any(
+            subscription.matches(event_type, event_step) and (
+                not subscription.own_events_only
+                or (self.origin_character is not None and self.origin_character.name == origin_character_name)
+            )
+            for subscription in self.subscriptions
+        )
+
     def get_possibilities_on_event(self, event: Event) -> list[RandomOutcome] | list[Choice] | None:
         pass
 
+    def fingerprint(self) -> Fingerprint:
+        """Canonical key of the module internal state, characters are identified by their name"""
+        return fingerprint_fields(self)
+
+    def save(self) -> object:
+        """
+        Snapshot of the module internal state, restored when a search rolls back an outcome
+
+        Modules with internal state must override save and restore
+        """
+        return None
+
+    def restore(self, snapshot: object) -> None:
+        pass
+
+    def encode(self, writer: BinaryWriter) -> None:
+        """Write the module internal state for the state codec, modules overriding save and restore must override encode and decode"""
+        pass
+
+    def decode(self, reader: BinaryReader) -> None:
+        pass
+
     @abstractmethod
     def on_event(self, event: Event, chosen_outcome: RandomOutcome | Choice | None) -> Optional[Event]:
         pass
@@ -0,0 +1,136 @@
+from array import array
+from dataclasses import dataclass, field
+
+import numpy as np
+import numpy.typing as npt
+
+from event import Choice, RandomOutcome
+from instrumentation import get_recorder
+from state import State
+from tree import leaf_strategy
+
+NO_NODE = -1
+
+
+@dataclass
+class NodeStore:
+    """
+    Explored tree stored as flat arrays, without a Python object per node or per edge
+
+    Children of a node are contiguous and always stored after their parent
+    Outcome names are interned as codes, probabilities are float64 (1 for choices)
+    Leaf scores are stored for every creature, NaN for inner nodes
+    """
+    creature_names: list[str]
+    outcome_names: list[str] = field(init=False, default_factory=list)
+    outcome_codes_by_name: dict[str, int] = field(init=False, default_factory=dict)
+    parents: array = field(init=False, default_factory=lambda: array('i'))
+    outcome_codes: array = field(init=False, default_factory=lambda: array('H'))
+    probabilities: array = field(init=False, default_factory=lambda: array('d'))
+    first_children: array = field(init=False, default_factory=lambda: array('i'))
+    children_counts: array = field(init=False, default_factory=lambda: array('H'))
+    deciding_creatures: array = field(init=False, default_factory=lambda: array('h')) # Creature index for choice nodes, -1 otherwise
+    scores: array = field(init=False, default_factory=lambda: array('d')) # Node major, one value per creature
+
+    @staticmethod
+    def exhaust(state: State, absolute_round_limit: int = 1) -> 'NodeStore':
+        """Explore the whole tree depth first, walking the state in place"""
+        store = NodeStore(creature_names=[creature.name for creature in state.creatures])
+        root = store.add_node(NO_NODE, None)
+        store.expand(state, root, absolute_round_limit, depth=0)
+        return store
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def add_node(self, parent: int, outcome: Choice | RandomOutcome | None) -> int:
+        match outcome:
+            case Choice():
+                name, probability = outcome.name, 1.
+            case RandomOutcome():
+                name, probability = outcome.name.name, float(outcome.probability)
+            case _:
+                name, probability = 'root', 1.
+        if name not in self.outcome_codes_by_name:
+            self.outcome_codes_by_name[name] = len(self.outcome_names)
+            self.outcome_names.append(name)
+        self.parents.append(parent)
+        self.outcome_codes.append(self.outcome_codes_by_name[name])
+        self.probabilities.append(probability)
+        self.first_children.append(NO_NODE)
+        self.children_counts.append(0)
+        self.deciding_creatures.append(NO_NODE)
+        self.scores.extend([np.nan] * len(self.creature_names))
+        return len(self.parents) - 1
+
+    def expand(self, state: State, node: int, absolute_round_limit: int, depth: int) -> None:
+        if (recorder := get_recorder()) is not None:
+            recorder.record_node(depth)
+        possible_outcomes = state.forward_until_branch(absolute_round_limit=absolute_round_limit)
+        if possible_outcomes is None:
+            leaf_scores = leaf_strategy(state).scores
+            offset = node * len(self.creature_names)
+            for creature_index, creature_name in enumerate(self.creature_names):
+                self.scores[offset + creature_index] = float(leaf_scores[creature_name].value)
+            return
+        if all(isinstance(outcome, Choice) for outcome in possible_outcomes):
+            self.deciding_creatures[node] = self.creature_names.index(state.current_turn_creature().name)
+        self.first_children[node] = len(self)
+        self.children_counts[node] = len(possible_outcomes)
+        for outcome in possible_outcomes:
+            self.add_node(node, outcome)
+        for outcome_index in range(len(possible_outcomes)):
+            snapshot = state.save()
+            state.do_outcome(outcome_index)
+            self.expand(state, self.first_children[node] + outcome_index, absolute_round_limit, depth + 1)
+            state.restore(snapshot)
+
+    def children(self, node: int) -> range:
+        first_child = self.first_children[node]
+        return range(first_child, first_child + self.children_counts[node])
+
+    def outcome_name(self, node: int) -> str:
+        return self.outcome_names[self.outcome_codes[node]]
+
+    def values(self) -> npt.NDArray[np.float64]:
+        """Expectimax score of every node for every creature, same rules as find_best_strategy"""
+        values = np.array(self.scores, dtype=np.float64).reshape(len(self), len(self.creature_names))
+        # Children are stored after their parent: a reverse pass sees children first
+        for node in reversed(range(len(self))):
+            children = self.children(node)
+            if len(children) == 0:
+                continue
+            deciding_creature = self.deciding_creatures[node]
+            if deciding_creature == NO_NODE:
+                probabilities = np.array(self.probabilities[children.start:children.stop])
+                values[node] = probabilities @ values[children.start:children.stop]
+            else:
+                values[node] = values[self.best_child(node, values)]
+        return values
+
+    def best_child(self, node: int, values: npt.NDArray[np.float64]) -> int:
+        """Last child with the best score for the deciding creature, like choices_strategy"""
+        children = self.children(node)
+        deciding_scores = values[children.start:children.stop, self.deciding_creatures[node]]
+        return children.start + len(deciding_scores) - 1 - int(np.argmax(deciding_scores[::-1]))
+
+    def best_choices(self) -> list[str]:
+        """Choices of the best strategy, the last random outcome is followed like random_outcomes_strategy"""
+        values = self.values()
+        choices = []
+        node = 0
+        while len(children := self.children(node)) > 0:
+            if self.deciding_creatures[node] == NO_NODE:
+                node = children.stop - 1
+            else:
+                node = self.best_child(node, values)
+                choices.append(self.outcome_name(node))
+        return choices
+
+    def nbytes(self) -> int:
+        """Memory used by the arrays"""
+        arrays = [
+            self.parents, self.outcome_codes, self.probabilities, self.first_children,
+            self.children_counts, self.deciding_creatures, self.scores,
+        ]
+        return sum(len(values) * values.itemsize for values in arrays)
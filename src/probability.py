@@ -1,12 +1,531 @@
-
+import math
 from collections import defaultdict
-from dataclasses import dataclass
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import Enum, auto
 from fractions import Fraction
-from typing import Callable
+from typing import Callable, Collection, Iterator
 
+import numpy as np
+import numpy.typing as npt
 
-@dataclass
+# Above this support width (for both operands), float convolutions go through FFT
+FFT_CONVOLUTION_THRESHOLD = 64
+# Integer weights are stored as int64 while the denominator, which bounds every weight, is below this
+INT64_DENOMINATOR_LIMIT = 2 ** 62
+
+
+class ProbabilityMode(Enum):
+    EXACT = auto() # Integer weights over a shared denominator
+    FLOAT = auto() # float64 probabilities
+
+
+_probability_mode = ProbabilityMode.EXACT
+
+
+def get_probability_mode() -> ProbabilityMode:
+    return _probability_mode
+
+
+def set_probability_mode(mode: ProbabilityMode) -> None:
+    global _probability_mode
+    _probability_mode = mode
+
+
+@contextmanager
+def probability_mode(mode: ProbabilityMode) -> Iterator[None]:
+    """Run a computation (like a whole tree search) with the given probability mode"""
+    previous_mode = get_probability_mode()
+    set_probability_mode(mode)
+    try:
+        yield
+    finally:
+        set_probability_mode(previous_mode)
+
+
+class UnreducedFraction:
+    """Exact rational number that is only reduced when reported
+
+    Fraction normalizes with a gcd on every operation. Here denominators are aligned
+    when one divides the other (dices denominators are products like 20^k * 6^m)
+    and simply multiplied otherwise.
+    """
+    __slots__ = ('numerator', 'denominator')
+
+    def __init__(self, numerator: int = 0, denominator: int = 1) -> None:
+        assert denominator > 0
+        self.numerator = numerator
+        self.denominator = denominator
+
+    @staticmethod
+    def cast(value: object) -> 'UnreducedFraction | None':
+        if isinstance(value, UnreducedFraction):
+            return value
+        if isinstance(value, (int, Fraction)):
+            return UnreducedFraction(value.numerator, value.denominator)
+        return None
+
+    def reduced(self) -> Fraction:
+        return Fraction(self.numerator, self.denominator)
+
+    def __add__(self, value: 'Probability | int') -> 'Probability':
+        if isinstance(value, float):
+            return float(self) + value
+        other = UnreducedFraction.cast(value)
+        if other is None:
+            return NotImplemented
+        if self.denominator == other.denominator:
+            return UnreducedFraction(self.numerator + other.numerator, self.denominator)
+        if other.denominator % self.denominator == 0:
+            factor = other.denominator // self.denominator
+            return UnreducedFraction(self.numerator * factor + other.numerator, other.denominator)
+        if self.denominator % other.denominator == 0:
+            factor = self.denominator // other.denominator
+            return UnreducedFraction(self.numerator + other.numerator * factor, self.denominator)
+        return UnreducedFraction(
+            self.numerator * other.denominator + other.numerator * self.denominator,
+            self.denominator * other.denominator
+        )
+
+    __radd__ = __add__
+
+    def __neg__(self) -> 'UnreducedFraction':
+        return UnreducedFraction(-self.numerator, self.denominator)
+
+    def __sub__(self, value: 'Probability | int') -> 'Probability':
+        return self + (- value)
+
+    def __rsub__(self, value: 'Probability | int') -> 'Probability':
+        return (- self) + value
+
+    def __mul__(self, value: 'Probability | int') -> 'Probability':
+        if isinstance(value, float):
+            return float(self) * value
+        other = UnreducedFraction.cast(value)
+        if other is None:
+            return NotImplemented
+        return UnreducedFraction(self.numerator * other.numerator, self.denominator * other.denominator)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, value: 'Probability | int') -> 'Probability':
+        if isinstance(value, float):
+            return float(self) / value
+        other = UnreducedFraction.cast(value)
+        if other is None:
+            return NotImplemented
+        if other.numerator == 0:
+            raise ZeroDivisionError(f'{self} / 0')
+        # Comparisons rely on positive denominators
+        sign = 1 if other.numerator > 0 else -1
+        return UnreducedFraction(sign * self.numerator * other.denominator, sign * self.denominator * other.numerator)
+
+    def __rtruediv__(self, value: 'Probability | int') -> 'Probability':
+        if isinstance(value, float):
+            return value / float(self)
+        other = UnreducedFraction.cast(value)
+        if other is None:
+            return NotImplemented
+        return other / self
+
+    def __cross_products(self, value: 'Probability | int') -> tuple[int, int] | tuple[float, float]:
+        if isinstance(value, float):
+            return float(self), value
+        other = UnreducedFraction.cast(value)
+        assert other is not None
+        return self.numerator * other.denominator, other.numerator * self.denominator
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (UnreducedFraction, Fraction, int, float)):
+            return NotImplemented
+        left, right = self.__cross_products(other)
+        return left == right
+
+    def __lt__(self, other: 'Probability | int') -> bool:
+        left, right = self.__cross_products(other)
+        return left < right
+
+    def __le__(self, other: 'Probability | int') -> bool:
+        left, right = self.__cross_products(other)
+        return left <= right
+
+    def __gt__(self, other: 'Probability | int') -> bool:
+        left, right = self.__cross_products(other)
+        return left > right
+
+    def __ge__(self, other: 'Probability | int') -> bool:
+        left, right = self.__cross_products(other)
+        return left >= right
+
+    def __hash__(self) -> int:
+        return hash(self.reduced())
+
+    def __bool__(self) -> bool:
+        return self.numerator != 0
+
+    def __float__(self) -> float:
+        return self.numerator / self.denominator
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.numerator}, {self.denominator})'
+
+    def __str__(self) -> str:
+        return str(self.reduced())
+
+
+Probability = UnreducedFraction | Fraction | float
+
+
+def to_fraction(probability: Probability) -> Fraction:
+    if isinstance(probability, UnreducedFraction):
+        return probability.reduced()
+    return Fraction(probability)
+
+
+def exact_weights_dtype(denominator: int) -> type:
+    return np.int64 if denominator < INT64_DENOMINATOR_LIMIT else object
+
+
+def convolve(weights_1: npt.NDArray, weights_2: npt.NDArray, dtype: type | None = None) -> npt.NDArray:
+    """Return the distribution of the sum of two independent variables given their weights vectors
+
+    Exact (integer) vectors are convolved directly, float vectors with wide supports use FFT
+    """
+    is_float = weights_1.dtype.kind == 'f' and weights_2.dtype.kind == 'f'
+    if not is_float or min(len(weights_1), len(weights_2)) <= FFT_CONVOLUTION_THRESHOLD:
+        if dtype is not None:
+            weights_1, weights_2 = weights_1.astype(dtype), weights_2.astype(dtype)
+        return np.convolve(weights_1, weights_2)
+    size = len(weights_1) + len(weights_2) - 1
+    fft_size = 1 << (size - 1).bit_length()
+    spectrum = np.fft.rfft(weights_1, fft_size) * np.fft.rfft(weights_2, fft_size)
+    # FFT round-off can produce tiny negative probabilities
+    return np.clip(np.fft.irfft(spectrum, fft_size)[:size], 0, None)
+
+
+@dataclass(frozen=True)
+class Moments:
+    """Mean and variance of a random variable
+
+    Moments of independent variables add up, so they can be computed without any distribution
+    """
+    mean: Fraction = Fraction()
+    variance: Fraction = Fraction()
+
+    def __add__(self, other: 'Moments | int') -> 'Moments':
+        if isinstance(other, int):
+            return Moments(self.mean + other, self.variance)
+        return Moments(self.mean + other.mean, self.variance + other.variance)
+
+    def __neg__(self) -> 'Moments':
+        return Moments(-self.mean, self.variance)
+
+    def __sub__(self, other: 'Moments | int') -> 'Moments':
+        return self + (- other)
+
+    def __mul__(self, count: int) -> 'Moments':
+        """Moments of the sum of count independent copies"""
+        return Moments(self.mean * count, self.variance * count)
+
+
+@dataclass(eq=False)
 class RandomVariable:
+    """Integer random variable stored as a contiguous weights vector
+
+    The probability of the value offset + i is weights[i] / denominator
+    In exact mode weights are integers (int64 or python int when the denominator is too big),
+    in float mode weights are float64 probabilities and the denominator is 1
+    """
+    offset: int
+    weights: npt.NDArray
+    denominator: int = 1
+    frozen: bool = field(init=False, default=False, repr=False)
+
+    def __post_init__(self) -> None:
+        non_zero_indexes = np.flatnonzero(self.weights)
+        assert len(non_zero_indexes) > 0
+        # Trim zeros on both ends to keep the support as small as possible
+        first, last = non_zero_indexes[0], non_zero_indexes[-1]
+        if first != 0 or last != len(self.weights) - 1:
+            self.offset += int(first)
+            self.weights = self.weights[first:last + 1]
+        if self.is_exact():
+            assert sum(self.weights) == self.denominator
+        else:
+            assert np.isclose(self.weights.sum(), 1)
+
+    def is_exact(self) -> bool:
+        return self.weights.dtype.kind != 'f'
+
+    def min_value(self) -> int:
+        return self.offset
+
+    def max_value(self) -> int:
+        return self.offset + len(self.weights) - 1
+
+    def values(self) -> npt.NDArray[np.int64]:
+        return np.arange(self.offset, self.offset + len(self.weights), dtype=np.int64)
+
+    def probability(self, weight: int | float) -> Probability:
+        """Report a weight (or a sum of weights) as a probability"""
+        if self.is_exact():
+            return UnreducedFraction(int(weight), self.denominator)
+        return float(weight)
+
+    @property
+    def probabilities(self) -> npt.NDArray:
+        if self.is_exact():
+            return np.array([Fraction(int(weight), self.denominator) for weight in self.weights], dtype=object)
+        return self.weights
+
+    @property
+    def outcomes(self) -> dict[int, Probability]: # Value -> Probability
+        return {
+            int(value): self.probability(weight)
+            for value, weight in zip(self.values(), self.weights)
+            if weight != 0
+        }
+
+    def probability_of_being_between(self, min_included: int, max_included: int) -> Probability:
+        start = max(min_included - self.offset, 0)
+        end = max(max_included - self.offset + 1, 0)
+        return self.probability(self.weights[start:end].sum())
+
+    def probability_of_being_superior_or_equal_to(self, threshold: int) -> Probability:
+        return self.probability_of_being_between(threshold, self.max_value())
+
+    def probability_of_being_inferior_or_equal_to(self, threshold: int) -> Probability:
+        return self.probability_of_being_between(self.min_value(), threshold)
+
+    def cumulative_weights(self, start: int, end: int, dtype: type | None = None) -> npt.NDArray:
+        """Return denominator * P(X <= v) for every v in [start, end]"""
+        cumulative = np.cumsum(self.weights if dtype is None else self.weights.astype(dtype))
+        indexes = np.arange(start, end + 1) - self.offset
+        # Below the support the CDF is 0, above it is 1
+        padded = np.concatenate((np.zeros(1, dtype=cumulative.dtype), cumulative))
+        return padded[np.clip(indexes + 1, 0, len(cumulative))]
+
+    def survival_weights(self, start: int, end: int, dtype: type | None = None) -> npt.NDArray:
+        """Return denominator * P(X >= v) for every v in [start, end]"""
+        return self.denominator - self.cumulative_weights(start - 1, end - 1, dtype)
+
+    def probability_of_being_superior_to(self, other: 'RandomVariable') -> Probability:
+        """Return P(X > Y) in linear time from X survival function, without building X - Y"""
+        denominator, dtype = self.__joint_denominator(other)
+        survival = self.survival_weights(other.min_value() + 1, other.max_value() + 1, dtype)
+        weight = np.dot(other.weights.astype(dtype or np.float64), survival)
+        if dtype is None:
+            return float(weight)
+        return UnreducedFraction(int(weight), denominator)
+
+    def max_of(self, other: 'RandomVariable') -> 'RandomVariable':
+        """Distribution of max(X, Y) from P(max <= v) = P(X <= v) * P(Y <= v)"""
+        denominator, dtype = self.__joint_denominator(other)
+        start, end = min(self.min_value(), other.min_value()), max(self.max_value(), other.max_value())
+        cumulative = self.cumulative_weights(start, end, dtype) * other.cumulative_weights(start, end, dtype)
+        return RandomVariable(start, np.diff(cumulative, prepend=0), denominator)
+
+    def min_of(self, other: 'RandomVariable') -> 'RandomVariable':
+        """Distribution of min(X, Y) from P(min >= v) = P(X >= v) * P(Y >= v)"""
+        denominator, dtype = self.__joint_denominator(other)
+        start, end = min(self.min_value(), other.min_value()), max(self.max_value(), other.max_value())
+        survival = self.survival_weights(start, end + 1, dtype) * other.survival_weights(start, end + 1, dtype)
+        return RandomVariable(start, - np.diff(survival), denominator)
+
+    def order_statistic(self, count: int, rank: int) -> 'RandomVariable':
+        """Distribution of the rank-th lowest value of count independent rolls
+
+        rank=count keeps the highest (Elven Accuracy is order_statistic(3, 3)), rank=1 keeps the lowest
+        P(X_(rank) <= v) = sum over j >= rank of C(count, j) F(v)^j (1 - F(v))^(count - j)
+        """
+        assert 1 <= rank <= count
+        if self.is_exact():
+            denominator = self.denominator ** count
+            dtype: type | None = exact_weights_dtype(denominator)
+        else:
+            denominator, dtype = 1, None
+        cumulative = self.cumulative_weights(self.min_value(), self.max_value(), dtype)
+        complement = self.denominator - cumulative
+        order_cumulative = sum(
+            (math.comb(count, j) * cumulative ** j * complement ** (count - j) for j in range(rank, count + 1)),
+            start=np.zeros(len(cumulative), dtype=cumulative.dtype)
+        )
+        return RandomVariable(self.offset, np.diff(order_cumulative, prepend=0), denominator)
+
+    def highest_of(self, count: int) -> 'RandomVariable':
+        return self.order_statistic(count, count)
+
+    def lowest_of(self, count: int) -> 'RandomVariable':
+        return self.order_statistic(count, 1)
+
+    def __exact_power_sums(self) -> tuple[int, int]:
+        """Return sum of weight * value and sum of weight * value^2 with python integers"""
+        first_order, second_order = 0, 0
+        for value, weight in zip(self.values().tolist(), self.weights.tolist()):
+            first_order += weight * value
+            second_order += weight * value * value
+        return first_order, second_order
+
+    def mean(self) -> Probability:
+        if self.is_exact():
+            first_order, _ = self.__exact_power_sums()
+            return UnreducedFraction(first_order, self.denominator)
+        return float(np.dot(self.values(), self.weights))
+
+    def variance(self) -> Probability:
+        if self.is_exact():
+            first_order, second_order = self.__exact_power_sums()
+            return UnreducedFraction(
+                second_order * self.denominator - first_order ** 2,
+                self.denominator ** 2
+            )
+        mean = np.dot(self.values(), self.weights)
+        return float(np.dot(self.values() ** 2, self.weights) - mean ** 2)
+
+    def moments(self) -> Moments:
+        return Moments(to_fraction(self.mean()), to_fraction(self.variance()))
+
+    @staticmethod
+    def from_weights(offset: int, weights: list[int], denominator: int) -> 'RandomVariable':
+        """Build a random variable in the current probability mode"""
+        if get_probability_mode() is ProbabilityMode.FLOAT:
+            return RandomVariable(offset, np.array(weights, dtype=np.float64) / denominator)
+        return RandomVariable(offset, np.array(weights, dtype=exact_weights_dtype(denominator)), denominator)
+
+    @staticmethod
+    def from_outcomes(outcomes: dict[int, Fraction]) -> 'RandomVariable':
+        offset = min(outcomes)
+        denominator = math.lcm(*(Fraction(probability).denominator for probability in outcomes.values()))
+        weights = [0] * (max(outcomes) - offset + 1)
+        for value, probability in outcomes.items():
+            weights[value - offset] += int(probability * denominator)
+        return RandomVariable.from_weights(offset, weights, denominator)
+
+    @staticmethod
+    def from_range(start_included: int, end_included: int) -> 'RandomVariable':
+        width = end_included - start_included + 1
+        return RandomVariable.from_weights(start_included, [1] * width, width)
+
+    @staticmethod
+    def from_values(values: list[int]) -> 'RandomVariable':
+        """Return random variable with uniform distribution from given values
+
+        If a value appear several times in list, it has more chance to appear
+        """
+        unique_values, counts = np.unique(values, return_counts=True)
+        offset = int(unique_values[0])
+        weights = [0] * (int(unique_values[-1]) - offset + 1)
+        for value, count in zip(unique_values.tolist(), counts.tolist()):
+            weights[value - offset] = count
+        return RandomVariable.from_weights(offset, weights, len(values))
+
+    def sample(self, size: int, generator: np.random.Generator) -> npt.NDArray[np.int64]:
+        """Draw size independent values at once"""
+        probabilities = self.weights.astype(np.float64) / self.denominator
+        return generator.choice(self.values(), size=size, p=probabilities / probabilities.sum())
+
+    def freeze(self) -> 'RandomVariable':
+        """Make the weights vector read only so the variable can be shared"""
+        self.weights.flags.writeable = False
+        self.frozen = True
+        return self
+
+    def copy(self) -> 'RandomVariable':
+        return RandomVariable(self.offset, self.weights.copy(), self.denominator)
+
+    def to_float(self) -> 'RandomVariable':
+        return RandomVariable(self.offset, self.weights.astype(np.float64) / self.denominator)
+
+    def __joint_denominator(self, other: 'RandomVariable') -> tuple[int, type | None]:
+        if not self.is_exact() or not other.is_exact():
+            assert not self.is_exact() and not other.is_exact(), 'Cannot mix exact and float random variables'
+            return 1, None
+        denominator = self.denominator * other.denominator
+        return denominator, exact_weights_dtype(denominator)
+
+    def __add__(self, other: 'RandomVariable | int') -> 'RandomVariable':
+        if isinstance(other, int):
+            return RandomVariable(self.offset + other, self.weights, self.denominator)
+        denominator, dtype = self.__joint_denominator(other)
+        return RandomVariable(
+            self.offset + other.offset,
+            convolve(self.weights, other.weights, dtype),
+            denominator
+        )
+
+    def sum_of_copies(self, count: int) -> 'RandomVariable':
+        """Distribution of the sum of count independent copies, by exponentiation by squaring"""
+        assert count >= 0
+        result = RandomVariable(0, np.ones(1, dtype=self.weights.dtype))
+        power = self
+        while count > 0:
+            if count & 1:
+                result = result + power
+            count >>= 1
+            if count > 0:
+                power = power + power
+        return result
+
+    def __neg__(self) -> 'RandomVariable':
+        return RandomVariable(-self.max_value(), self.weights[::-1].copy(), self.denominator)
+
+    def __sub__(self, other: 'RandomVariable | int') -> 'RandomVariable':
+        return self + (- other)
+
+    def scaled(self, multiplier: Fraction) -> 'RandomVariable':
+        """Distribution of values multiplied by multiplier and rounded down"""
+        if multiplier == 1:
+            return self
+        scaled_values = np.array([math.floor(value * multiplier) for value in self.values().tolist()], dtype=np.int64)
+        offset = int(scaled_values.min())
+        scaled_weights = np.zeros(int(scaled_values.max()) - offset + 1, dtype=self.weights.dtype)
+        np.add.at(scaled_weights, scaled_values - offset, self.weights)
+        return RandomVariable(offset, scaled_weights, self.denominator)
+
+    def merge(self, other: 'RandomVariable', value_merge_func: Callable[[int, int], int]) -> 'RandomVariable':
+        if value_merge_func is max:
+            return self.max_of(other)
+        if value_merge_func is min:
+            return self.min_of(other)
+        merged_values = np.array(np.frompyfunc(value_merge_func, 2, 1).outer(self.values(), other.values()), dtype=np.int64)
+        denominator, dtype = self.__joint_denominator(other)
+        weights_1, weights_2 = self.weights, other.weights
+        if dtype is not None:
+            weights_1, weights_2 = weights_1.astype(dtype), weights_2.astype(dtype)
+        joint_weights = np.multiply.outer(weights_1, weights_2)
+        offset = int(merged_values.min())
+        merged_weights = np.zeros(int(merged_values.max()) - offset + 1, dtype=joint_weights.dtype)
+        np.add.at(merged_weights, (merged_values - offset).ravel(), joint_weights.ravel())
+        return RandomVariable(offset, merged_weights, denominator)
+
+    def reroll_on_values(self, values_to_reroll: Collection[int]) -> None:
+        if self.frozen:
+            raise ValueError('Cannot reroll a frozen random variable, copy it first')
+        indexes = [value - self.offset for value in values_to_reroll]
+        if any(not 0 <= index < len(self.weights) or self.weights[index] == 0 for index in indexes):
+            raise ValueError('Value to reroll do not exist')
+        # P'(v) = P(v) * (kept(v) + P(reroll)), over the squared denominator in exact mode
+        reroll_weight = self.weights[indexes].sum()
+        if self.is_exact():
+            denominator = self.denominator ** 2
+            dtype = exact_weights_dtype(denominator)
+            factors: npt.NDArray = np.full(len(self.weights), self.denominator + int(reroll_weight), dtype=dtype)
+            factors[indexes] = int(reroll_weight)
+            # Rebind instead of writing in place: the vector may be shared with other variables
+            self.weights = self.weights.astype(dtype) * factors
+            self.denominator = denominator
+            return
+        float_factors = np.full(len(self.weights), 1 + reroll_weight)
+        float_factors[indexes] = reroll_weight
+        self.weights = self.weights * float_factors
+
+
+@dataclass
+class DictRandomVariable:
+    """Reference implementation of RandomVariable backed by a dict
+
+    Kept to cross-check the array backend
+    """
     outcomes: dict[int, Fraction] # Value -> Probability
 
     def probability_of_being_between(self, min_included: int, max_included: int) -> Fraction:
@@ -24,11 +543,11 @@ class RandomVariable:
         return result_probability
 
     @staticmethod
-    def from_range(start_included: int, end_included: int) -> 'RandomVariable':
-        return RandomVariable.from_values(list(range(start_included, end_included + 1)))
+    def from_range(start_included: int, end_included: int) -> 'DictRandomVariable':
+        return DictRandomVariable.from_values(list(range(start_included, end_included + 1)))
 
     @staticmethod
-    def from_values(values: list[int]) -> 'RandomVariable':
+    def from_values(values: list[int]) -> 'DictRandomVariable':
         """Return random variable with uniform distribution from given values
 
         If a value appear several times in list, it has more chance to appear
@@ -37,36 +556,36 @@ class RandomVariable:
         outcomes: dict[int, Fraction] = defaultdict(Fraction)
         for value in values:
             outcomes[value] += Fraction(1, n)
-        return RandomVariable(outcomes)
+        return DictRandomVariable(outcomes)
 
     def __post_init__(self) -> None:
         assert sum(self.outcomes.values()) == 1
 
-    def __add__(self, other: 'RandomVariable | int') -> 'RandomVariable':
+    def __add__(self, other: 'DictRandomVariable | int') -> 'DictRandomVariable':
         if isinstance(other, int):
-            other = RandomVariable({other: Fraction(1)})
+            other = DictRandomVariable({other: Fraction(1)})
         return self.merge(other, lambda v1, v2: v1 + v2)
 
-    def __neg__(self) -> 'RandomVariable':
+    def __neg__(self) -> 'DictRandomVariable':
         outcomes = {}
         for value, probability in self.outcomes.items():
             outcomes[-value] = probability
-        return RandomVariable(outcomes)
+        return DictRandomVariable(outcomes)
 
-    def __sub__(self, other: 'RandomVariable | int') -> 'RandomVariable':
+    def __sub__(self, other: 'DictRandomVariable | int') -> 'DictRandomVariable':
         if isinstance(other, int):
-            other = RandomVariable({other: Fraction(1)})
+            other = DictRandomVariable({other: Fraction(1)})
         return self + (- other)
 
-    def merge(self, other: 'RandomVariable', value_merge_func: Callable[[int, int], int]) -> 'RandomVariable':
+    def merge(self, other: 'DictRandomVariable', value_merge_func: Callable[[int, int], int]) -> 'DictRandomVariable':
         merged_outcomes: dict[int, Fraction] = defaultdict(Fraction)
         for value_1, probability_1 in self.outcomes.items():
             for value_2, probability_2 in other.outcomes.items():
                 merged_value = value_merge_func(value_1, value_2)
                 merged_outcomes[merged_value] += probability_1 * probability_2
-        return RandomVariable(merged_outcomes)
+        return DictRandomVariable(merged_outcomes)
 
-    def reroll_on_values(self, values_to_reroll: list[int]) -> None:
+    def reroll_on_values(self, values_to_reroll: Collection[int]) -> None:
         if any(True for value in values_to_reroll if value not in self.outcomes):
             raise ValueError('Value to reroll do not exist')
         reroll_probability = Fraction(0)
@@ -84,11 +603,12 @@ def get_d20_roll(reroll_fumble: bool) -> RandomVariable:
     return d20_random_var
 
 
-def advantage_disadvantage(random_variable: RandomVariable, advantage: bool, disadvantage: bool) -> RandomVariable:
+def advantage_disadvantage(random_variable: RandomVariable, advantage: bool, disadvantage: bool, advantage_roll_count: int = 2) -> RandomVariable:
+    """Advantage keeps the highest of advantage_roll_count rolls (3 with Elven Accuracy)"""
     match advantage, disadvantage:
         case True, False:
-            return random_variable.merge(random_variable, max)
+            return random_variable.highest_of(advantage_roll_count)
         case False, True:
-            return random_variable.merge(random_variable, min)
+            return random_variable.lowest_of(2)
         case _:
             return random_variable
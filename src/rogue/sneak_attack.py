@@ -2,10 +2,11 @@ import logging
 from dataclasses import dataclass, field
 
 from action import ActionEvent
+from binary import BinaryReader, BinaryWriter
 from damage import Damage
 from dices import Dice
 from event import Choice, Event, EventSteps, RandomOutcome, StartOfTurnEvent
-from module import Module
+from module import Module, Subscription
 from weapon import WeaponProperties
 
 LOGGER = logging.getLogger('dnd')
@@ -13,8 +14,25 @@ LOGGER = logging.getLogger('dnd')
 
 @dataclass
 class SneakAttack(Module):
+    subscriptions = (
+        Subscription((StartOfTurnEvent,)),
+        Subscription((ActionEvent,), frozenset({EventSteps.REGULAR_HIT, EventSteps.CRIT}), own_events_only=True),
+    )
     available: bool = field(default=False, init=False)
 
+    def save(self) -> object:
+        return self.available
+
+    def restore(self, snapshot: object) -> None:
+        assert isinstance(snapshot, bool)
+        self.available = snapshot
+
+    def encode(self, writer: BinaryWriter) -> None:
+        writer.write_bool(self.available)
+
+    def decode(self, reader: BinaryReader) -> None:
+        self.available = reader.read_bool()
+
     def on_event(self, event: Event, chosen_outcome: RandomOutcome | Choice | None) -> Event | None:
         if isinstance(event, StartOfTurnEvent):
             self.available = True
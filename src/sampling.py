@@ -0,0 +1,42 @@
+from dataclasses import dataclass
+from statistics import NormalDist
+
+import numpy as np
+import numpy.typing as npt
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def random_generator(seed: int | None = None) -> np.random.Generator:
+    """Sampling is always driven by an explicit generator so runs can be reproduced"""
+    return np.random.default_rng(seed)
+
+
+@dataclass
+class SampleSummary:
+    size: int
+    mean: float
+    standard_deviation: float
+    quantiles: dict[float, float]
+    confidence: float
+    confidence_interval: tuple[float, float] # For the mean, using the normal approximation
+
+    @staticmethod
+    def from_samples(samples: npt.NDArray, quantiles: tuple[float, ...] = DEFAULT_QUANTILES, confidence: float = 0.95) -> 'SampleSummary':
+        size = len(samples)
+        mean = float(samples.mean())
+        standard_deviation = float(samples.std(ddof=1)) if size > 1 else 0.
+        half_width = NormalDist().inv_cdf((1 + confidence) / 2) * standard_deviation / np.sqrt(size)
+        return SampleSummary(
+            size=size,
+            mean=mean,
+            standard_deviation=standard_deviation,
+            quantiles=dict(zip(quantiles, np.quantile(samples, quantiles).tolist())),
+            confidence=confidence,
+            confidence_interval=(mean - half_width, mean + half_width),
+        )
+
+    def is_consistent_with(self, expected_mean: float) -> bool:
+        """Cross-check an exact mean against the sampled confidence interval"""
+        low, high = self.confidence_interval
+        return low <= float(expected_mean) <= high
@@ -0,0 +1,506 @@
+import copy
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Hashable, Iterator, Sequence, cast
+
+from action import ActionEvent
+from action_cost import ActionCost
+from cache import CacheStatistics, LRUCache
+from character import DamageTaken
+from codec import decode_state, encode_state
+from event import Choice, EndOfTurnEvent, RandomOutcome, StartOfTurnEvent
+from fingerprint import Fingerprint
+from instrumentation import Recorder, get_recorder, recording
+from probability import (Probability, ProbabilityMode, get_probability_mode,
+                         set_probability_mode)
+from state import State
+from tree import (Strategy, avg_dmg_dealt_to_punching_ball_scoring,
+                  choices_strategy, get_creature_from_id, leaf_strategy,
+                  random_outcomes_strategy, scored_damage_taken)
+from utils import ExplainedValue
+from warlock.eldritch_blast import EldritchBlast
+
+# Score of a creature below which a subtree cannot change any decision
+Threshold = tuple[str, Probability]
+# Lower and upper bounds of a creature score over all the subtree leaves
+Bounds = Callable[[State, str], tuple[Probability, Probability]]
+
+
+@dataclass
+class SearchStatistics:
+    nodes: int = 0
+    leaves: int = 0
+    max_depth: int = 0
+    pruned: int = 0 # Children skipped because they could not change the best choice
+    depth_cutoffs: int = 0 # Nodes scored as leaves because the depth limit was reached
+    truncated: int = 0 # Nodes scored from their bounds because their path probability is too low
+    truncated_probability: float = 0. # Probability of reaching a truncated node with the best strategy
+    error_bound: float = 0. # Worst case error of the best strategy scores caused by truncated nodes
+
+    def add(self, other: 'SearchStatistics') -> None:
+        self.nodes += other.nodes
+        self.leaves += other.leaves
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.pruned += other.pruned
+        self.depth_cutoffs += other.depth_cutoffs
+        self.truncated += other.truncated
+
+
+class SearchBudgetExceeded(Exception):
+    """Raised when a search runs out of time or nodes, the walked state is rolled back first"""
+
+
+@dataclass
+class TranspositionTable:
+    """Strategies of already evaluated states, indexed by state fingerprint
+
+    Different choice orders often reach identical states: they are evaluated once and the tree becomes a DAG
+    Strategies depend on the search which evaluated them, a table is bound to the configuration of its first search
+    """
+    maxsize: int = 1_000_000
+    # Strategies with the damage taken they were evaluated after, to explain them on other paths
+    strategies: LRUCache[Fingerprint, tuple[DamageTaken | None, Strategy]] = field(init=False)
+    configuration: Hashable = field(init=False, default=None)
+
+    def __post_init__(self) -> None:
+        self.strategies = LRUCache(maxsize=self.maxsize)
+
+    @property
+    def statistics(self) -> CacheStatistics:
+        return self.strategies.statistics
+
+    def bind(self, configuration: Hashable) -> None:
+        if self.configuration is None:
+            self.configuration = configuration
+        elif self.configuration != configuration:
+            raise ValueError(f'Transposition table bound to the search configuration {self.configuration}, not {configuration}')
+
+    def get_or_evaluate(self, state: State, evaluate: Callable[[], Strategy]) -> Strategy:
+        # Stored strategies are never handed out, parents would insert their choices in them
+        damage_taken = scored_damage_taken(state)
+        evaluated_after, strategy = self.strategies.get_or_compute(state.fingerprint(), lambda: (damage_taken, evaluate()))
+        return strategy.transposed(evaluated_after, damage_taken)
+
+    def clear(self) -> None:
+        self.strategies.clear()
+        self.configuration = None
+
+
+@dataclass
+class DepthFirstSearch:
+    """Expand and score the outcome tree depth first without building TreeNodes
+
+    A single state is walked in place: each outcome is applied, evaluated and rolled back
+    Return the same strategy as find_best_strategy(exhaust_tree(state))
+    With a transposition table, identical states are only expanded once
+    With a probability threshold, nodes less likely than it are not expanded but scored with their lower bounds:
+    the truncated probability mass and the resulting worst case error are reported in the statistics
+    With a depth limit, nodes below it are scored as leaves with the damage already dealt
+    """
+    absolute_round_limit: int = 1
+    transposition_table: TranspositionTable | None = None
+    probability_threshold: float = 0.
+    bounds: Bounds | None = None
+    depth_limit: int | None = None
+    deadline: float | None = None # time.perf_counter() value
+    node_budget: int | None = None
+    statistics: SearchStatistics = field(init=False, default_factory=SearchStatistics)
+
+    def __post_init__(self) -> None:
+        if self.probability_threshold > 0 and self.bounds is None:
+            raise ValueError('Bounds are needed to score truncated nodes')
+        if (self.probability_threshold > 0 or self.depth_limit is not None) and self.transposition_table is not None:
+            raise ValueError('Truncated strategies depend on the path to the state, they cannot be shared')
+
+    def find_best_strategy(self, state: State) -> Strategy:
+        self.statistics = SearchStatistics()
+        if self.transposition_table is not None:
+            # Truncated searches cannot use a table, only the horizon and the arithmetic change strategies
+            self.transposition_table.bind((self.absolute_round_limit, get_probability_mode()))
+        strategy = self.evaluate(state, depth=0)
+        self.statistics.truncated_probability = strategy.truncated_probability
+        self.statistics.error_bound = strategy.error_bound
+        return strategy
+
+    def evaluate(self, state: State, depth: int, path_probability: float = 1.) -> Strategy:
+        if path_probability < self.probability_threshold:
+            return self.truncate(state, path_probability)
+        if self.transposition_table is None:
+            return self.expand(state, depth, path_probability)
+        return self.transposition_table.get_or_evaluate(state, lambda: self.expand(state, depth, path_probability))
+
+    def truncate(self, state: State, path_probability: float) -> Strategy:
+        """Score each creature with its lower bound, the error is at most the gap with its upper bound"""
+        assert self.bounds is not None
+        self.statistics.truncated += 1
+        scores: dict[str, ExplainedValue] = {}
+        error_bound = 0.
+        for creature in state.creatures:
+            lower, upper = self.bounds(state, creature.name)
+            scores[creature.name] = ExplainedValue(value=lower, history=f'lower bound {lower}')
+            error_bound = max(error_bound, float(upper - lower))
+        return Strategy(choices=[], scores=scores, truncated_probability=1., error_bound=error_bound)
+
+    def expand(self, state: State, depth: int, path_probability: float = 1.) -> Strategy:
+        self.statistics.nodes += 1
+        if (recorder := get_recorder()) is not None:
+            recorder.record_node(depth)
+        self.statistics.max_depth = max(self.statistics.max_depth, depth)
+        if self.node_budget is not None and self.statistics.nodes > self.node_budget:
+            raise SearchBudgetExceeded(f'More than {self.node_budget} nodes')
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchBudgetExceeded('Deadline reached')
+        possible_outcomes = state.forward_until_branch(absolute_round_limit=self.absolute_round_limit)
+        if possible_outcomes is None:
+            self.statistics.leaves += 1
+            return leaf_strategy(state)
+        if self.depth_limit is not None and depth >= self.depth_limit:
+            self.statistics.depth_cutoffs += 1
+            return leaf_strategy(state)
+        if all(isinstance(outcome, RandomOutcome) for outcome in possible_outcomes):
+            return random_outcomes_strategy(
+                (cast(RandomOutcome, outcome), strategy) for outcome, strategy in self.children(state, possible_outcomes, depth, path_probability)
+            )
+        elif all(isinstance(outcome, Choice) for outcome in possible_outcomes):
+            return choices_strategy(
+                state.current_turn_creature().name,
+                ((cast(Choice, outcome), strategy) for outcome, strategy in self.children(state, possible_outcomes, depth, path_probability))
+            )
+        else:
+            raise ValueError('Unexpected: not uniform type of outcomes')
+
+    def children(self, state: State, possible_outcomes: Sequence[Choice | RandomOutcome], depth: int, path_probability: float = 1.) -> Iterator[tuple[Choice | RandomOutcome, Strategy]]:
+        """Lazily evaluate children, the state is rolled back after each of them"""
+        for outcome_index, possible_outcome in enumerate(possible_outcomes):
+            child_path_probability = path_probability
+            if isinstance(possible_outcome, RandomOutcome):
+                child_path_probability *= float(possible_outcome.probability)
+            snapshot = state.save()
+            state.do_outcome(outcome_index)
+            try:
+                strategy = self.evaluate(state, depth + 1, child_path_probability)
+            finally:
+                state.restore(snapshot)
+            yield possible_outcome, strategy
+
+
+@dataclass
+class AnytimeResult:
+    strategy: Strategy | None # None when the budget ran out before the first iteration finished
+    depth_limit: int = 0 # Depth limit of the iteration that produced the strategy
+    completed: bool = False # The whole tree was searched, the strategy is exact
+    nodes: int = 0 # Over all iterations
+    elapsed: float = 0. # Seconds
+
+
+@dataclass
+class IterativeDeepeningSearch:
+    """Anytime search: depth first searches with an increasing depth limit until the budget runs out
+
+    Return the strategy of the deepest iteration that finished
+    """
+    absolute_round_limit: int = 1
+    time_budget: float | None = None # Seconds
+    node_budget: int | None = None # Over all iterations
+
+    def find_best_strategy(self, state: State) -> AnytimeResult:
+        start = time.perf_counter()
+        deadline = start + self.time_budget if self.time_budget is not None else None
+        result = AnytimeResult(strategy=None)
+        depth_limit = 1
+        while True:
+            search = DepthFirstSearch(
+                absolute_round_limit=self.absolute_round_limit,
+                depth_limit=depth_limit,
+                deadline=deadline,
+                node_budget=self.node_budget - result.nodes if self.node_budget is not None else None,
+            )
+            try:
+                strategy = search.find_best_strategy(copy.deepcopy(state))
+            except SearchBudgetExceeded:
+                result.nodes += search.statistics.nodes
+                break
+            result.nodes += search.statistics.nodes
+            result.strategy = strategy
+            result.depth_limit = depth_limit
+            if search.statistics.depth_cutoffs == 0:
+                result.completed = True
+                break
+            depth_limit += 1
+        result.elapsed = time.perf_counter() - start
+        return result
+
+
+@dataclass
+class SplitNode:
+    """Node expanded by the parallel search before its subtrees are handed to workers"""
+    deciding_creature_id: str
+    possible_outcomes: Sequence[Choice | RandomOutcome]
+    children: list['SplitNode | Strategy | Subtree']
+
+
+@dataclass
+class Subtree:
+    """Subtree evaluated by a worker, which does not receive the hits already taken"""
+    result: Future[tuple[Strategy, SearchStatistics, Recorder | None]]
+    damage_taken: DamageTaken | None
+
+
+# State of each worker process, subtrees states are decoded into it
+_worker_state: State | None = None
+
+
+def set_worker_state(state: State, mode: ProbabilityMode) -> None:
+    """
+    Worker initializer, any state built like the searched one can receive the encoded subtrees states
+
+    Workers do not inherit the probability mode of the caller with the spawn or forkserver start methods
+    """
+    global _worker_state
+    _worker_state = state
+    set_probability_mode(mode)
+
+
+def evaluate_subtree(
+    search: DepthFirstSearch, encoded_state: bytes, depth: int, record: bool,
+) -> tuple[Strategy, SearchStatistics, Recorder | None]:
+    """
+    Worker entry point, must stay at module level to be picklable
+
+    When the caller is recording, the worker records the subtree and returns its recorder to be merged
+    """
+    assert _worker_state is not None, 'Worker state must be set by the pool initializer'
+    decode_state(encoded_state, _worker_state)
+    search.statistics = SearchStatistics()
+    if not record:
+        return search.evaluate(_worker_state, depth), search.statistics, None
+    with recording() as recorder:
+        strategy = search.evaluate(_worker_state, depth)
+    return strategy, search.statistics, recorder
+
+
+@dataclass
+class ParallelSearch:
+    """Depth first search with subtrees below split_depth evaluated by a pool of processes
+
+    Subtrees are queued in tree order and picked by idle workers, results are merged in the same order
+    so the strategy is exactly the one of the sequential search
+    Workers receive the searched state once, then only the encoded progress of each subtree
+    """
+    absolute_round_limit: int = 1
+    split_depth: int = 3
+    max_workers: int | None = None # Defaults to the number of processors
+    use_transposition_table: bool = False # One table per subtree, workers do not share them
+    start_method: str | None = None # Multiprocessing start method, defaults to the platform one
+    statistics: SearchStatistics = field(init=False, default_factory=SearchStatistics)
+
+    def find_best_strategy(self, state: State) -> Strategy:
+        self.statistics = SearchStatistics()
+        with ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=None if self.start_method is None else multiprocessing.get_context(self.start_method),
+            initializer=set_worker_state,
+            initargs=(copy.deepcopy(state), get_probability_mode()),
+        ) as executor:
+            return self.merge(self.split(state, 0, executor))
+
+    def split(self, state: State, depth: int, executor: ProcessPoolExecutor) -> SplitNode | Strategy | Subtree:
+        if depth == self.split_depth:
+            search = DepthFirstSearch(
+                absolute_round_limit=self.absolute_round_limit,
+                transposition_table=TranspositionTable() if self.use_transposition_table else None,
+            )
+            return Subtree(
+                executor.submit(evaluate_subtree, search, encode_state(state), depth, get_recorder() is not None),
+                scored_damage_taken(state),
+            )
+        self.statistics.nodes += 1
+        if (recorder := get_recorder()) is not None:
+            recorder.record_node(depth)
+        self.statistics.max_depth = max(self.statistics.max_depth, depth)
+        possible_outcomes = state.forward_until_branch(absolute_round_limit=self.absolute_round_limit)
+        if possible_outcomes is None:
+            self.statistics.leaves += 1
+            return leaf_strategy(state)
+        split_node = SplitNode(state.current_turn_creature().name, possible_outcomes, children=[])
+        for outcome_index in range(len(possible_outcomes)):
+            snapshot = state.save()
+            state.do_outcome(outcome_index)
+            split_node.children.append(self.split(state, depth + 1, executor))
+            state.restore(snapshot)
+        return split_node
+
+    def merge(self, node: SplitNode | Strategy | Subtree) -> Strategy:
+        match node:
+            case Strategy():
+                return node
+            case Subtree():
+                strategy, statistics, worker_recorder = node.result.result()
+                self.statistics.add(statistics)
+                if worker_recorder is not None and (recorder := get_recorder()) is not None:
+                    recorder.add(worker_recorder)
+                # Hits taken in the worker followed a decoded state without hits
+                return strategy.transposed(None, node.damage_taken)
+        if all(isinstance(outcome, RandomOutcome) for outcome in node.possible_outcomes):
+            return random_outcomes_strategy(
+                (cast(RandomOutcome, outcome), self.merge(child)) for outcome, child in zip(node.possible_outcomes, node.children)
+            )
+        elif all(isinstance(outcome, Choice) for outcome in node.possible_outcomes):
+            return choices_strategy(
+                node.deciding_creature_id,
+                ((cast(Choice, outcome), self.merge(child)) for outcome, child in zip(node.possible_outcomes, node.children))
+            )
+        else:
+            raise ValueError('Unexpected: not uniform type of outcomes')
+
+
+@dataclass
+class DamageBounds:
+    """Score bounds when creatures are scored on damage dealt to the punching ball
+
+    Damage taken never decreases and each remaining attack deals at most max_damage_per_attack
+    Remaining attacks are counted from the state: chosen attacks not resolved yet, the ones the current creature
+    can still make this turn (its action if available, eldritch blasts left) and attacks_per_turn for each following turn
+    of a creature hostile to the punching ball, until the round limit
+    """
+    max_damage_per_attack: int
+    attacks_per_turn: int
+    absolute_round_limit: int = 1
+
+    def __call__(self, state: State, creature_id: str) -> tuple[Probability, Probability]:
+        lower = avg_dmg_dealt_to_punching_ball_scoring(creature_id, state).value
+        return lower, lower + self.max_damage_per_attack * self.remaining_attacks(state)
+
+    def remaining_attacks(self, state: State) -> int:
+        punching_ball = get_creature_from_id('punching_ball', state)
+        attacks = sum(1 for event in state.event_queue if isinstance(event, ActionEvent) and event.is_an_attack)
+        turn_started = not any(isinstance(event, StartOfTurnEvent) for event in state.event_queue)
+        turn_ended = any(isinstance(event, EndOfTurnEvent) for event in state.event_queue)
+        # Turns not started yet of each creature, the current one included when its start is still queued
+        first_turn = state.current_turn_index + 1 if turn_started else state.current_turn_index
+        last_turn = len(state.creatures) * (self.absolute_round_limit - state.round_number + 1)
+        turns = Counter(turn % len(state.creatures) for turn in range(first_turn, last_turn))
+        for creature_index, creature in enumerate(state.creatures):
+            if not creature.is_hostile_to(punching_ball):
+                continue
+            playing = creature_index == state.current_turn_index and turn_started and not turn_ended
+            attacks += self.attacks_per_turn * turns[creature_index]
+            if playing and creature.action_availability.get(ActionCost.ACTION, False):
+                attacks += self.attacks_per_turn
+            if playing or turns[creature_index] > 0:
+                # Blasts left are free and kept until they are used
+                attacks += sum(
+                    module.number_of_blast_left for module in state.modules
+                    if isinstance(module, EldritchBlast) and module.origin_character is creature
+                )
+        return attacks
+
+
+@dataclass
+class PrunedSearch:
+    """Depth first search skipping subtrees that cannot change the best choice (Star1 pruning)
+
+    Each choice node gives its next children the score of its best child so far as a threshold,
+    chance nodes stop as soon as their children scores and the upper bound of the remaining ones
+    cannot reach it. Thresholds are strict so ties are still evaluated and resolved as in find_best_strategy
+    Return the same strategy as DepthFirstSearch when bounds are valid
+    """
+    bounds: Bounds
+    absolute_round_limit: int = 1
+    statistics: SearchStatistics = field(init=False, default_factory=SearchStatistics)
+
+    def find_best_strategy(self, state: State) -> Strategy:
+        self.statistics = SearchStatistics()
+        strategy = self.evaluate(state, depth=0, threshold=None)
+        assert strategy is not None, 'Root cannot be pruned without threshold'
+        return strategy
+
+    def evaluate(self, state: State, depth: int, threshold: Threshold | None) -> Strategy | None:
+        """Return None when the score is proven strictly below the threshold"""
+        self.statistics.nodes += 1
+        if (recorder := get_recorder()) is not None:
+            recorder.record_node(depth)
+        self.statistics.max_depth = max(self.statistics.max_depth, depth)
+        possible_outcomes = state.forward_until_branch(absolute_round_limit=self.absolute_round_limit)
+        if possible_outcomes is None:
+            self.statistics.leaves += 1
+            return leaf_strategy(state)
+        if all(isinstance(outcome, RandomOutcome) for outcome in possible_outcomes):
+            return self.evaluate_random_outcomes(state, cast(list[RandomOutcome], possible_outcomes), depth, threshold)
+        elif all(isinstance(outcome, Choice) for outcome in possible_outcomes):
+            return self.evaluate_choices(state, cast(list[Choice], possible_outcomes), depth, threshold)
+        else:
+            raise ValueError('Unexpected: not uniform type of outcomes')
+
+    def evaluate_choices(self, state: State, choices: list[Choice], depth: int, threshold: Threshold | None) -> Strategy | None:
+        deciding_creature_id = state.current_turn_creature().name
+        # A threshold on another creature score says nothing about this creature decision
+        minimum = threshold[1] if threshold is not None and threshold[0] == deciding_creature_id else None
+        best_strategy: Strategy | None = None
+        children: list[tuple[Choice, Strategy]] = []
+        for outcome_index, choice in enumerate(choices):
+            child_minimum = minimum
+            if best_strategy is not None:
+                best_score = best_strategy.scores[deciding_creature_id].value
+                child_minimum = best_score if child_minimum is None else max(child_minimum, best_score)
+            snapshot = state.save()
+            state.do_outcome(outcome_index)
+            strategy = self.evaluate_child(state, depth, None if child_minimum is None else (deciding_creature_id, child_minimum))
+            state.restore(snapshot)
+            if strategy is None:
+                continue
+            children.append((choice, strategy))
+            best_strategy = strategy
+        if best_strategy is None or (minimum is not None and best_strategy.scores[deciding_creature_id].value < minimum):
+            return None
+        return choices_strategy(deciding_creature_id, children)
+
+    def evaluate_random_outcomes(self, state: State, random_outcomes: list[RandomOutcome], depth: int, threshold: Threshold | None) -> Strategy | None:
+        if threshold is None:
+            children = []
+            for outcome_index, random_outcome in enumerate(random_outcomes):
+                snapshot = state.save()
+                state.do_outcome(outcome_index)
+                strategy = self.evaluate_child(state, depth, None)
+                state.restore(snapshot)
+                assert strategy is not None
+                children.append((random_outcome, strategy))
+            return random_outcomes_strategy(children)
+        creature_id, minimum = threshold
+        _, upper_bound = self.bounds(state, creature_id)
+        children = []
+        evaluated_score: Probability = 0
+        remaining_probability: Probability = 1
+        for outcome_index, random_outcome in enumerate(random_outcomes):
+            remaining_probability = remaining_probability - random_outcome.probability
+            # Score this child must reach when all following children reach the upper bound
+            optimistic_rest = evaluated_score + remaining_probability * upper_bound
+            if random_outcome.probability == 0:
+                child_threshold = None
+            else:
+                child_threshold = (creature_id, (minimum - optimistic_rest) / random_outcome.probability)
+            snapshot = state.save()
+            state.do_outcome(outcome_index)
+            strategy = self.evaluate_child(state, depth, child_threshold)
+            state.restore(snapshot)
+            if strategy is None:
+                self.statistics.pruned += len(random_outcomes) - outcome_index - 1
+                return None
+            children.append((random_outcome, strategy))
+            evaluated_score = evaluated_score + random_outcome.probability * strategy.scores[creature_id].value
+        return random_outcomes_strategy(children)
+
+    def evaluate_child(self, state: State, depth: int, threshold: Threshold | None) -> Strategy | None:
+        if threshold is not None:
+            _, upper_bound = self.bounds(state, threshold[0])
+            if upper_bound < threshold[1]:
+                self.statistics.pruned += 1
+                return None
+        strategy = self.evaluate(state, depth + 1, threshold)
+        # Leaves and other creatures decisions are evaluated exactly, whatever the threshold
+        if strategy is not None and threshold is not None and strategy.scores[threshold[0]].value < threshold[1]:
+            return None
+        return strategy
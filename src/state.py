@@ -1,16 +1,37 @@
+import bisect
 import copy
 import logging
-from dataclasses import dataclass, field
+import time
+from dataclasses import dataclass, field, fields
 
 from action import ActionCost, ActionEvent, ChoosingActionEvent
 from character import Character
 from event import (Choice, EndOfTurnEvent, Event, EventSteps, RandomOutcome,
                    StartOfTurnEvent)
+from fingerprint import Fingerprint
+from instrumentation import get_recorder
 from module import Module
 
 LOGGER = logging.getLogger('dnd')
 
+
 @dataclass
+class StateSnapshot:
+    """Everything an outcome can change, so a search can roll back in place instead of copying the state"""
+    current_turn_index: int
+    round_number: int
+    event_queue: list[Event]
+    possibles_outcomes: list[RandomOutcome] | list[Choice] | None
+    events: list[tuple[Event, object]]
+    creatures: list[object]
+    modules: list[object]
+
+
+# Fields of states only depending on their creatures and modules
+SHARED_INDEXES = frozenset({'subscribers', 'hostile_targets'})
+
+
+@dataclass(slots=True)
 class State:
     creatures: list[Character]
     modules: list[Module]
@@ -18,6 +39,78 @@ class State:
     current_turn_index: int = field(init=False, default=0)
     round_number: int = field(init=False, default=1)
     possibles_outcomes: list[RandomOutcome] | list[Choice] | None = field(init=False, default=None)
+    # Indexes filled on demand and shared by copies, reset_indexes must be called when creatures or modules change
+    # Indexes of modules subscribed to (event type, event step, origin character name)
+    subscribers: dict[tuple[type[Event], EventSteps, str], list[int]] = field(init=False, default_factory=dict)
+    # Indexes of creatures hostile to each creature by name
+    hostile_targets: dict[str, list[int]] = field(init=False, default_factory=dict)
+
+    def __deepcopy__(self, memo: dict) -> 'State':
+        state = State.__new__(State)
+        memo[id(self)] = state
+        for state_field in fields(self):
+            value = getattr(self, state_field.name)
+            setattr(state, state_field.name, value if state_field.name in SHARED_INDEXES else copy.deepcopy(value, memo))
+        return state
+
+    def reset_indexes(self) -> None:
+        """New indexes, copies sharing the previous ones keep them"""
+        self.subscribers = {}
+        self.hostile_targets = {}
+
+    def fingerprint(self) -> Fingerprint:
+        """
+        Canonical key of the state: two states with the same fingerprint have the same future
+
+        Possible outcomes are not part of it since they are recomputed from the current event
+        """
+        return (
+            self.round_number,
+            self.current_turn_index,
+            tuple(creature.fingerprint() for creature in self.creatures),
+            tuple(module.fingerprint() for module in self.modules),
+            tuple(event.fingerprint() for event in self.event_queue),
+        )
+
+    def save(self) -> StateSnapshot:
+        return StateSnapshot(
+            current_turn_index=self.current_turn_index,
+            round_number=self.round_number,
+            event_queue=list(self.event_queue),
+            possibles_outcomes=self.possibles_outcomes,
+            events=[(event, event.save()) for event in self.__tracked_events()],
+            creatures=[creature.save() for creature in self.creatures],
+            modules=[module.save() for module in self.modules],
+        )
+
+    def restore(self, snapshot: StateSnapshot) -> None:
+        """Roll back to a snapshot, events created since then are dropped. A snapshot can be restored several times"""
+        self.current_turn_index = snapshot.current_turn_index
+        self.round_number = snapshot.round_number
+        self.event_queue = list(snapshot.event_queue)
+        self.possibles_outcomes = snapshot.possibles_outcomes
+        for event, event_snapshot in snapshot.events:
+            event.restore(event_snapshot)
+        for creature, creature_snapshot in zip(self.creatures, snapshot.creatures):
+            creature.restore(creature_snapshot)
+        for module, module_snapshot in zip(self.modules, snapshot.modules):
+            module.restore(module_snapshot)
+
+    def __tracked_events(self) -> list[Event]:
+        """
+        Events that may be processed later: queued ones, possible actions and chosen actions
+
+        Action templates are never processed, only their instances
+        """
+        events: dict[int, Event] = {}
+        for event in self.event_queue:
+            events[id(event)] = event
+            if isinstance(event, ChoosingActionEvent):
+                events.update((id(possible_event), possible_event) for possible_event in event.possible_actions if not isinstance(possible_event, ActionEvent))
+        for outcome in self.possibles_outcomes or []:
+            if isinstance(outcome, Choice) and not isinstance(outcome.choice, ActionEvent):
+                events[id(outcome.choice)] = outcome.choice
+        return list(events.values())
 
     def trigger_next_turn(self) -> None:
         # should rely on initiative score
@@ -37,14 +130,27 @@ class State:
         return None
 
     def current_event_module(self) -> Module | None:
+        """Next module subscribed to the current event step, modules in between are skipped"""
         current_event = self.current_event()
         if current_event is None:
             return None
-        current_module_index = current_event.event_processing_module_index
-        if current_module_index < len(self.modules):
-            return self.modules[current_module_index]
+        subscribers = self.event_subscribers(current_event)
+        subscriber_index = bisect.bisect_left(subscribers, current_event.event_processing_module_index)
+        if subscriber_index < len(subscribers):
+            current_event.event_processing_module_index = subscribers[subscriber_index]
+            return self.modules[current_event.event_processing_module_index]
+        current_event.event_processing_module_index = len(self.modules)
         return None
 
+    def event_subscribers(self, event: Event) -> list[int]:
+        key = (type(event), event.event_step, event.origin_character.name)
+        if key not in self.subscribers:
+            self.subscribers[key] = [
+                module_index for module_index, module in enumerate(self.modules)
+                if module.is_subscribed(*key)
+            ]
+        return self.subscribers[key]
+
     def apply_action_event_cost(self, action_event: ActionEvent) -> None:
         if action_event.action_cost is ActionCost.NONE:
             return
@@ -70,15 +176,12 @@ class State:
         if not isinstance(current_event, ChoosingActionEvent) or current_event.event_step is not EventSteps.AFTER_EVENT:
             return current_event.get_possible_outcomes()
         # If it is a ChoosingActionEvent, return all possibles action
-        choices = []
+        choices: list[Choice] = []
         for possible_event in current_event.possible_actions:
             if isinstance(possible_event, ActionEvent):
-                for target in self.search_all_targets(action_event=possible_event):
-                    possible_event_copy = copy.copy(possible_event)
-                    possible_event_copy.target = target
-                    choices.append(Choice(choice=possible_event_copy, name=f'{possible_event.action_module.__name__} on {target.name}'))
+                choices.extend(Choice(possible_event, target) for target in self.search_targets(possible_event))
             else:
-                choices.append(Choice(choice=possible_event, name=f'{possible_event.__class__.__name__}'))
+                choices.append(Choice(possible_event))
         assert len(choices) > 0
         return choices
 
@@ -95,12 +198,20 @@ class State:
         assert current_event is not None
         current_module = self.current_event_module()
         if current_module is not None:
-            interrupting_event = current_module.on_event(current_event, chosen_outcome=outcome)
+            recorder = get_recorder()
+            if recorder is None:
+                interrupting_event = current_module.on_event(current_event, chosen_outcome=outcome)
+            else:
+                start = time.perf_counter()
+                interrupting_event = current_module.on_event(current_event, chosen_outcome=outcome)
+                recorder.record_module_event(current_module, time.perf_counter() - start)
             current_event.event_processing_module_index += 1
             if interrupting_event is not None:
                 self.event_queue.append(interrupting_event)
             return
         # Process event current step since all modules are done
+        if (recorder := get_recorder()) is not None:
+            recorder.record_event_step(current_event)
         current_event.do_outcome(outcome=outcome)
         if current_event.event_step is EventSteps.END:
             self.event_queue.pop()
@@ -110,13 +221,15 @@ class State:
                 return
             if isinstance(current_event, ChoosingActionEvent):
                 assert isinstance(outcome, Choice)
-                assert isinstance(outcome.choice, Event)
-                self.event_queue.append(outcome.choice)
-                if isinstance(outcome.choice, ActionEvent):
-                    self.apply_action_event_cost(outcome.choice)
-                    outcome.choice.on_action_selected_callback()
+                chosen_event = outcome.instantiate()
+                self.event_queue.append(chosen_event)
+                if isinstance(chosen_event, ActionEvent):
+                    self.apply_action_event_cost(chosen_event)
+                    chosen_event.on_action_selected_callback()
 
     def logging_progress(self) -> None:
+        if not LOGGER.isEnabledFor(logging.DEBUG):
+            return
         current_event = self.current_event()
         debug_text_lines = [f'Current event: {current_event.__class__.__name__}']
         debug_text_lines.append(f'Current step: {current_event.event_step.name if current_event is not None else None}')
@@ -140,5 +253,12 @@ class State:
             self.logging_progress()
         return possibles_outcomes
 
-    def search_all_targets(self, action_event: ActionEvent) -> list[Character]:
-        return self.creatures
+    def search_targets(self, action_event: ActionEvent) -> list[Character]:
+        """Hostile creatures, every creature is in reach since positions are not modelled yet"""
+        origin_name = action_event.origin_character.name
+        if origin_name not in self.hostile_targets:
+            self.hostile_targets[origin_name] = [
+                creature_index for creature_index, creature in enumerate(self.creatures)
+                if action_event.origin_character.is_hostile_to(creature)
+            ]
+        return [self.creatures[creature_index] for creature_index in self.hostile_targets[origin_name]]
@@ -1,18 +1,17 @@
 
 
+import copy
 from collections import defaultdict
 from dataclasses import dataclass, field
-from fractions import Fraction
-from typing import cast
+from typing import Iterable, cast
 
-from character import Character
-from damage import Damage
+from character import Character, DamageTaken
 from event import Choice, RandomOutcome
 from state import State
-from utils import ExplainedValue, HistoryAddition
+from utils import ExplainedValue, History, HistoryAddition
 
 
-@dataclass
+@dataclass(slots=True)
 class TreeNode:
     state: State
     outcome: RandomOutcome | Choice | None = None
@@ -30,72 +29,227 @@ class TreeNode:
     def print_full_tree(self, suffix: str = '') -> None:
         new_suffix = suffix + f' -> {self.outcome.name}' if self.outcome is not None else ''
         if len(self.children) == 0:
-            print(new_suffix + f' -> {[(creature.name, creature.total_damage_taken) for creature in self.state.creatures]}')
+            print(new_suffix + f' -> {[(creature.name, creature.damage_taken()) for creature in self.state.creatures]}')
             return
         for child in self.children:
             child.print_full_tree(suffix=new_suffix)
 
 
-@dataclass
+@dataclass(slots=True)
 class Strategy:
     choices: list[str]
     scores: dict[str, ExplainedValue]
+    # Probability to reach a node that was not expanded and worst case error of scores because of it
+    truncated_probability: float = 0.
+    error_bound: float = 0.
+    # Back pointers to explain scores on demand: children of random outcomes, last hit taken at leaves
+    # and strategies evaluated after other hits, reused by transpositions
+    random_children: list[tuple[RandomOutcome, 'Strategy']] | None = None
+    scored_on_damage_taken: bool = False
+    damage_taken: DamageTaken | None = None
+    transposition: 'Transposition | None' = None
+
+    def copy(self) -> 'Strategy':
+        """Parents insert their choices in front of children ones, shared strategies must be copied"""
+        return Strategy(
+            choices=list(self.choices),
+            scores=copy.copy(self.scores),
+            truncated_probability=self.truncated_probability,
+            error_bound=self.error_bound,
+            random_children=self.random_children,
+            scored_on_damage_taken=self.scored_on_damage_taken,
+            damage_taken=self.damage_taken,
+            transposition=self.transposition,
+        )
+
+    def transposed(self, evaluated_after: DamageTaken | None, damage_taken: DamageTaken | None) -> 'Strategy':
+        """
+        Copy for a path with other hits than the one it was evaluated on
+
+        Leaves are explained with the hits of this path, followed by the ones they took after evaluated_after
+        """
+        if evaluated_after is damage_taken:
+            return self.copy()
+        return Strategy(
+            choices=list(self.choices),
+            scores=copy.copy(self.scores),
+            truncated_probability=self.truncated_probability,
+            error_bound=self.error_bound,
+            transposition=Transposition(self, evaluated_after, damage_taken),
+        )
+
+    def explained(self) -> 'Strategy':
+        """Copy with the history of every score, only the chosen line is kept by back pointers"""
+        strategy = self.copy()
+        strategy.scores = explain_scores(self, {})
+        return strategy
+
+
+@dataclass(frozen=True, slots=True)
+class Transposition:
+    strategy: Strategy
+    evaluated_after: DamageTaken | None
+    damage_taken: DamageTaken | None
+
+
+# Hits taken after the first damage taken of each pair are replayed after the second one, innermost pair first
+Rebases = tuple[tuple[DamageTaken | None, DamageTaken | None], ...]
+
+
+def rebase_damage_taken(damage_taken: DamageTaken | None, rebases: Rebases) -> DamageTaken | None:
+    for evaluated_after, path_damage_taken in rebases:
+        later_hits = []
+        while damage_taken is not evaluated_after:
+            assert damage_taken is not None, 'Hits of a transposed strategy must follow the ones it was evaluated after'
+            later_hits.append(damage_taken)
+            damage_taken = damage_taken.previous
+        damage_taken = path_damage_taken
+        for hit in reversed(later_hits):
+            damage_taken = DamageTaken(hit.damage, damage_taken, hit.damage_multipliers)
+    return damage_taken
+
+
+def creature_avg_damage_taken(creature: Character) -> ExplainedValue:
+    """
+    Average is computed from dices moments when the creature takes damage, distributions are never built for scoring
+
+    The value is the running total of the creature, it is explained on demand by damage_taken_history
+    """
+    return ExplainedValue(value=creature.expected_damage_taken, history=None)
+
+
+def damage_taken_history(damage_taken: DamageTaken | None) -> History:
+    return HistoryAddition(values=[
+        f'avg({hit.damage.repr_multiplied(hit.damage_multipliers)})' for hit in ([] if damage_taken is None else damage_taken.hits())
+    ])
 
-def avg_total_damage_taken(tot_dmg_taken: list[Damage]) -> ExplainedValue:
-    return ExplainedValue(
-        value=sum((dmg.avg() for dmg in tot_dmg_taken), start=Fraction()),
-        history=HistoryAddition(values=[f'avg({dmg})' for dmg in tot_dmg_taken])
-    )
 
 def avg_dmg_dealt_to_punching_ball_scoring(creature_id: str, state: State) -> ExplainedValue:
-    enemy_dmg_taken = get_creature_from_id('punching_ball', state).total_damage_taken
-    return avg_total_damage_taken(enemy_dmg_taken)
+    return creature_avg_damage_taken(get_creature_from_id('punching_ball', state))
 
 
 def get_creature_from_id(creature_id: str, state: State) -> Character:
-    return {creature.name: creature for creature in state.creatures}[creature_id]
+    for creature in state.creatures:
+        if creature.name == creature_id:
+            return creature
+    raise KeyError(creature_id)
+
+
+def scored_damage_taken(state: State) -> DamageTaken | None:
+    """Hits explaining scores of the state"""
+    return get_creature_from_id('punching_ball', state).last_damage_taken
 
 
-def find_best_strategy(node: TreeNode) -> Strategy:
+def leaf_strategy(state: State) -> Strategy:
+    # Every creature is scored on the same damage, values are never modified in place
+    score = avg_dmg_dealt_to_punching_ball_scoring('punching_ball', state)
+    return Strategy(
+        choices=[],
+        scores={creature.name: score for creature in state.creatures},
+        scored_on_damage_taken=True,
+        damage_taken=scored_damage_taken(state),
+    )
+
+
+def random_outcomes_strategy(children: Iterable[tuple[RandomOutcome, Strategy]]) -> Strategy:
+    """Return weighted avg scores of children strategies and keep choice history"""
+    random_children = list(children)
+    truncated_probability = error_bound = 0.
+    for random_outcome, strategy in random_children:
+        truncated_probability += float(random_outcome.probability) * strategy.truncated_probability
+        error_bound += float(random_outcome.probability) * strategy.error_bound
+    scores = weighted_scores((random_outcome, strategy.scores) for random_outcome, strategy in random_children)
+    # TODO Choices can be different for some random outcomes !!
+    return Strategy(strategy.choices, scores, truncated_probability, error_bound, random_children=random_children)
+
+
+def weighted_scores(children_scores: Iterable[tuple[RandomOutcome, dict[str, ExplainedValue]]]) -> dict[str, ExplainedValue]:
+    """Histories are only built when children scores have one"""
+    scores: dict[str, ExplainedValue] = defaultdict(ExplainedValue)
+    for random_outcome, children_score in children_scores:
+        for creature_id, creature_score in children_score.items():
+            if creature_score.history is None:
+                factor = ExplainedValue(value=random_outcome.probability, history=None)
+            else:
+                factor = ExplainedValue(
+                    value=random_outcome.probability,
+                    history=f'{random_outcome.probability} ({random_outcome.name.name})',
+                )
+            scores[creature_id] +=  factor * creature_score
+    return scores
+
+
+def explain_scores(
+    strategy: Strategy,
+    explanations: dict[tuple, dict[str, ExplainedValue]],
+    rebases: Rebases = (),
+) -> dict[str, ExplainedValue]:
+    """
+    Rebuild scores with their history, strategies shared by transpositions are explained once per path hits
+
+    Strategies reused by transpositions are explained with the hits of the chosen line
+    """
+    key = (id(strategy), tuple((id(evaluated_after), id(damage_taken)) for evaluated_after, damage_taken in rebases))
+    if key in explanations:
+        return explanations[key]
+    if strategy.transposition is not None:
+        transposition = strategy.transposition
+        scores = explain_scores(
+            transposition.strategy, explanations, ((transposition.evaluated_after, transposition.damage_taken),) + rebases
+        )
+    elif strategy.random_children is not None:
+        scores = weighted_scores(
+            (random_outcome, explain_scores(child, explanations, rebases)) for random_outcome, child in strategy.random_children
+        )
+    elif strategy.scored_on_damage_taken:
+        history = damage_taken_history(rebase_damage_taken(strategy.damage_taken, rebases))
+        scores = {creature_id: ExplainedValue(score.value, history) for creature_id, score in strategy.scores.items()}
+    else:
+        # Scores not computed from damage, like bounds of truncated nodes, are explained from the start
+        scores = strategy.scores
+    explanations[key] = scores
+    return scores
+
+
+def choices_strategy(deciding_creature_id: str, children: Iterable[tuple[Choice, Strategy]]) -> Strategy:
+    """Return best score instance for the deciding creature and append choice history"""
+    best_strategy = Strategy(choices=[], scores=defaultdict(ExplainedValue))
+    error_bound = 0.
+    for choice, strategy in children:
+        # The best of approximated scores is at most the biggest children error away from the exact best
+        error_bound = max(error_bound, strategy.error_bound)
+        if best_strategy.scores[deciding_creature_id].value <= strategy.scores[deciding_creature_id].value:
+            best_strategy = strategy
+            strategy.choices.insert(0, choice.name)
+    best_strategy.error_bound = error_bound
+    return best_strategy
+
+
+def find_best_strategy(node: TreeNode, explain: bool = False) -> Strategy:
     """
     Scoring functions must be for each creatures
 
     Return which children you should choose if it's a choice
     Return the weighted average score if it's children if it's a random outcome
+    Children strategies are computed lazily, one at a time
+    Scores are only values unless explained, explanations are rebuilt for the chosen line
     """
+    if explain:
+        return find_best_strategy(node).explained()
     if len(node.children) == 0:
-        return Strategy(
-            choices=[],
-            scores={
-                creature.name: avg_dmg_dealt_to_punching_ball_scoring(creature.name, node.state)
-                for creature in node.state.creatures
-            }
-        )
+        return leaf_strategy(node.state)
     # When children are all determined by random outcome, return weighted avg scores and keep choice history
     elif all(isinstance(child.outcome, RandomOutcome) for child in node.children):
-        scores: dict[str, ExplainedValue] = defaultdict(ExplainedValue)
-        for child in node.children:
-            strategy = find_best_strategy(child)
-            for creature_id, creature_score in strategy.scores.items():
-                random_outcome = cast(RandomOutcome, child.outcome)
-                factor = ExplainedValue(
-                    value=random_outcome.probability,
-                    history=f'{random_outcome.probability} ({random_outcome.name.name})',
-                )
-                scores[creature_id] +=  factor * creature_score
-        # TODO Choices can be different for some random outcomes !!
-        return Strategy(strategy.choices, scores)
+        return random_outcomes_strategy(
+            (cast(RandomOutcome, child.outcome), find_best_strategy(child))
+            for child in node.children
+        )
     # When children are all choices, return best score instance for current node creature turn and append choice history
     # TODO: WRONG !!! Warning !! Best score is not he current turn creature but the creature making the decision
     elif all(isinstance(child.outcome, Choice) for child in node.children):
-        best_strategy = Strategy(choices=[], scores=defaultdict(ExplainedValue))
-        for child in node.children:
-            strategy = find_best_strategy(child)
-            current_turn_creature_id = node.state.current_turn_creature().name
-            if best_strategy.scores[current_turn_creature_id].value <= strategy.scores[current_turn_creature_id].value:
-                best_strategy = strategy
-                child_outcome = cast(Choice, child.outcome)
-                strategy.choices.insert(0, child_outcome.name)
-        return best_strategy
+        return choices_strategy(
+            node.state.current_turn_creature().name,
+            ((cast(Choice, child.outcome), find_best_strategy(child)) for child in node.children)
+        )
     else:
         raise ValueError('Unexpected: not uniform type of outcomes')
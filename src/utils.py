@@ -1,10 +1,11 @@
-import copy
 import logging
 from collections import defaultdict
 from dataclasses import dataclass, field
 from fractions import Fraction
 from typing import Any, Callable
 
+from probability import Probability
+
 LOGGER = logging.getLogger('dnd')
 
 def config_logging() -> None:
@@ -24,12 +25,12 @@ def debug_decorator(function: Callable) -> Callable:
 ### ExplainedValue types
 
 
-@dataclass
+@dataclass(slots=True)
 class HistoryAddition:
     values: list['History'] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class HistoryMultiplication:
     factor: str
     history: 'History'
@@ -58,15 +59,18 @@ def repr_history(history: History) -> str:
 
 
 
-@dataclass
+@dataclass(slots=True)
 class ExplainedValue:
-    value: Fraction = field(default_factory=Fraction)
-    history: History = HistoryAddition([])
+    """Value with the history of how it was computed, None when only the value is needed"""
+    value: Probability = field(default_factory=Fraction)
+    history: History | None = field(default_factory=HistoryAddition)
 
     def __add__(self, other: 'ExplainedValue') -> 'ExplainedValue':
+        if self.history is None or other.history is None:
+            return ExplainedValue(value=self.value + other.value, history=None)
         if isinstance(self.history, HistoryAddition):
-            history_addition = copy.deepcopy(self.history) # copy should be enough ?
-            history_addition.values.append(other.history)
+            # Histories are never modified in place, they can be shared
+            history_addition = HistoryAddition(values=[*self.history.values, other.history])
         else:
             history_addition = HistoryAddition(
                 values=[self.history, other.history]
@@ -77,6 +81,8 @@ class ExplainedValue:
         )
 
     def __mul__(self, other: 'ExplainedValue') -> 'ExplainedValue':
+        if self.history is None or other.history is None:
+            return ExplainedValue(value=self.value * other.value, history=None)
         if not isinstance(self.history, str):
             raise ValueError
         return ExplainedValue(
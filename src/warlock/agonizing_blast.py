@@ -3,7 +3,7 @@ from ability import Ability
 from action import ActionEvent
 from damage import DamageType
 from event import Choice, Event, EventSteps, RandomOutcome
-from module import Module
+from module import Module, Subscription
 from warlock.eldritch_blast import EldritchBlast
 
 
@@ -12,6 +12,10 @@ class AgonizingBlast(Module):
 
     When you cast eldritch blast, add your Charisma modifier to the damage it deals on hit
     """
+    subscriptions = (
+        Subscription((ActionEvent,), frozenset({EventSteps.REGULAR_HIT, EventSteps.CRIT}), own_events_only=True),
+    )
+
     def on_event(self, event: Event, chosen_outcome: RandomOutcome | Choice | None) -> Event | None:
         if not isinstance(event, ActionEvent):
             return None
@@ -1,6 +1,8 @@
 from dataclasses import dataclass
+from typing import Hashable
 
 from action import ActionCost, ActionEvent, Attack
+from binary import BinaryReader, BinaryWriter
 from damage import Damage, DamageType
 from dices import Dice, DiceBag
 from spell import Spell
@@ -10,12 +12,29 @@ from spell import Spell
 class EldritchBlast(Spell):
     number_of_blast_left: int = 0
 
+    def save(self) -> object:
+        return self.number_of_blast_left
+
+    def restore(self, snapshot: object) -> None:
+        assert isinstance(snapshot, int)
+        self.number_of_blast_left = snapshot
+
+    def encode(self, writer: BinaryWriter) -> None:
+        writer.write_uint(self.number_of_blast_left)
+
+    def decode(self, reader: BinaryReader) -> None:
+        self.number_of_blast_left = reader.read_uint()
+
     def on_action_use_callback(self) -> None:
         if self.number_of_blast_left == 0:
             self.number_of_blast_left = self.cantrip_multiplier() - 1
             return
         self.number_of_blast_left -= 1
 
+    def action_template_key(self) -> Hashable:
+        # Following blasts of the same action are free
+        return self.number_of_blast_left > 0
+
     def get_action_event(self) -> ActionEvent:
         assert self.origin_character is not None
 
@@ -1,17 +1,35 @@
 from dataclasses import dataclass, field
 
 from action import ActionEvent
+from binary import BinaryReader, BinaryWriter
 from damage import DamageType
 from event import (Choice, EndOfTurnEvent, Event, EventSteps, RandomOutcome,
                    StartOfTurnEvent)
-from module import Module
+from module import Module, Subscription
 
 
 @dataclass
 class GeniesWrath(Module):
+    subscriptions = (
+        Subscription((StartOfTurnEvent, EndOfTurnEvent), own_events_only=True),
+        Subscription((ActionEvent,), frozenset({EventSteps.REGULAR_HIT, EventSteps.CRIT}), own_events_only=True),
+    )
     damage_type: DamageType
     available: bool = field(default=False, init=False)
 
+    def save(self) -> object:
+        return self.available
+
+    def restore(self, snapshot: object) -> None:
+        assert isinstance(snapshot, bool)
+        self.available = snapshot
+
+    def encode(self, writer: BinaryWriter) -> None:
+        writer.write_bool(self.available)
+
+    def decode(self, reader: BinaryReader) -> None:
+        self.available = reader.read_bool()
+
     def on_event(self, event: Event, chosen_outcome: RandomOutcome | Choice | None) -> Event | None:
         if event.origin_character != self.origin_character:
             return None
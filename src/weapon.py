@@ -4,7 +4,7 @@ from enum import Flag, auto
 
 from ability import Ability
 from damage import Damage, DamageType
-from dices import Dice, DiceBag
+from dices import Dice
 
 
 class WeaponProperties(Flag):
@@ -30,7 +30,7 @@ class Weapon:
     properties: WeaponProperties
 
     def damage(self) -> Damage:
-        return Damage().add(self.damage_type, DiceBag(dices={(True, self.damage_dices): self.nb_of_dices}))
+        return Damage().add(self.damage_type, self.damage_dices * self.nb_of_dices)
 
 def shortbow() -> Weapon:
     return Weapon(
@@ -0,0 +1,52 @@
+from fractions import Fraction
+
+import pytest
+
+from action import Attack
+from attack_table import ATTACK_OUTCOME_TABLES
+from dices import Dice, DiceBag
+from event import EventSteps
+from probability import to_fraction
+
+# Beyond the armor classes every attack always hits or never regularly hits
+ARMOR_CLASSES = range(-5, 46)
+
+
+def brute_force_outcomes(attack: Attack, armor_class: int) -> dict[EventSteps, Fraction]:
+    """Enumerate every natural roll (two with advantage) and every modifier value"""
+    naturals = [max(a, b) if attack.advantage else a for a in range(1, 21) for b in range(1, 21)]
+    modifiers = attack.roll_modifiers.as_random_variable().outcomes
+    outcomes = {step: Fraction() for step in (EventSteps.FUMBLE, EventSteps.CRIT, EventSteps.REGULAR_HIT, EventSteps.REGULAR_MISS)}
+    for natural in naturals:
+        for modifier, probability in modifiers.items():
+            probability = to_fraction(probability) / len(naturals)
+            if natural == 1:
+                outcomes[EventSteps.FUMBLE] += probability
+            elif natural == 20:
+                outcomes[EventSteps.CRIT] += probability
+            elif natural + modifier >= armor_class:
+                outcomes[EventSteps.REGULAR_HIT] += probability
+            else:
+                outcomes[EventSteps.REGULAR_MISS] += probability
+    return outcomes
+
+
+@pytest.mark.parametrize(
+        argnames='attack',
+        argvalues=[
+            Attack(roll_modifiers=DiceBag(fix=5)),
+            Attack(roll_modifiers=DiceBag(fix=7) + Dice.d4, advantage=True),
+            Attack(roll_modifiers=DiceBag(fix=-3) - Dice.d4),
+        ]
+)
+def test_outcome_table_matches_brute_force(attack: Attack):
+    for armor_class in ARMOR_CLASSES:
+        outcomes = {outcome.name: outcome.probability for outcome in attack.get_random_outcomes(armor_class)}
+        assert outcomes == brute_force_outcomes(attack, armor_class)
+
+
+def test_outcome_table_is_shared_across_armor_classes():
+    ATTACK_OUTCOME_TABLES.clear()
+    for armor_class in ARMOR_CLASSES:
+        Attack(roll_modifiers=DiceBag(fix=4) + Dice.d6).get_random_outcomes(armor_class)
+    assert ATTACK_OUTCOME_TABLES.statistics.misses == 1
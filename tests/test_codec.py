@@ -0,0 +1,65 @@
+import copy
+
+import pytest
+
+from codec import CODEC_VERSION, MAGIC, decode_state, encode_state
+from damage import Damage, DamageType
+from dices import Dice
+from factory import LightFootHalflingRogue, TheGenie
+from search import DepthFirstSearch
+from state import State
+
+
+def walk(state: State, template: State, absolute_round_limit: int) -> int:
+    """Check every state of the tree round trips, return the number of states"""
+    possible_outcomes = state.forward_until_branch(absolute_round_limit=absolute_round_limit)
+    encoded_state = encode_state(state)
+    decode_state(encoded_state, template)
+    assert template.fingerprint() == state.fingerprint()
+    assert encode_state(template) == encoded_state
+    decode_state(encode_state(state, include_hits=True), template)
+    assert [repr(creature.damage_taken()) for creature in template.creatures] == [repr(creature.damage_taken()) for creature in state.creatures]
+    if possible_outcomes is None:
+        return 1
+    count = 1
+    for outcome_index in range(len(possible_outcomes)):
+        snapshot = state.save()
+        state.do_outcome(outcome_index)
+        count += walk(state, template, absolute_round_limit)
+        state.restore(snapshot)
+    return count
+
+
+@pytest.mark.parametrize('factory', [TheGenie, LightFootHalflingRogue])
+def test_encoded_states_round_trip(factory):
+    state = factory(5).get_test_state()
+    template = copy.deepcopy(state)
+    encoded_root = encode_state(state)
+    assert walk(state, template, absolute_round_limit=2) > 100
+    # The decoded state is searched like the original one
+    decode_state(encoded_root, template)
+    expected = DepthFirstSearch().find_best_strategy(state)
+    strategy = DepthFirstSearch().find_best_strategy(template)
+    assert strategy.choices == expected.choices
+    assert strategy.scores == expected.scores
+
+
+def test_decode_rejects_other_versions():
+    state = TheGenie(5).get_test_state()
+    encoded_state = encode_state(state)
+    with pytest.raises(ValueError):
+        decode_state(MAGIC + bytes([CODEC_VERSION + 1]) + encoded_state[len(MAGIC) + 1:], state)
+    with pytest.raises(ValueError):
+        decode_state(encoded_state[:-1], state)
+
+
+def test_encoded_states_do_not_grow_with_hits():
+    state = TheGenie(5).get_test_state()
+    damage = Damage().add(DamageType.Force, Dice.d10).add(DamageType.Force, 4)
+    state.creatures[0].takes_damage(damage)
+    encoded_state = encode_state(state)
+    for _ in range(50):
+        state.creatures[0].takes_damage(damage)
+    # Only the running total grows, by its number of digits
+    assert len(encode_state(state)) <= len(encoded_state) + 1
+    assert len(encode_state(state, include_hits=True)) > len(encode_state(state)) + 50
@@ -0,0 +1,56 @@
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+
+from ability import Ability
+from character import Character
+from damage import Damage, DamageType, damage_multipliers, dice_roll_column
+from dices import Dice, DiceBag, DiceRoll
+
+
+def test_damage_arithmetic():
+    damage = Damage().add(DamageType.Force, Dice.d10).add(DamageType.Force, 4)
+    other = Damage().add(DamageType.Fire, Dice.d6 * 2)
+    total = damage + other
+    assert total.avg() == damage.avg() + other.avg() == Fraction(11, 2) + 4 + 7
+    assert total.max_value() == 10 + 4 + 12
+    assert repr(total) == 'Damage(Fire: 2d6, Force: d10 + 4)'
+    critical = total.as_critical()
+    assert critical.avg() == 2 * Fraction(11, 2) + 4 + 14
+    assert critical[DamageType.Force].fix == 4
+    # Damage built before a dice roll is registered can still receive it
+    total[DamageType.Radiant] += DiceRoll(Dice.d12, advantage=True)
+    assert total.key() == (total + Damage()).key()
+    assert total.avg() == damage.avg() + other.avg() + DiceRoll(Dice.d12, advantage=True).moments().mean
+
+
+def test_damage_multipliers():
+    damage = Damage().add(DamageType.Fire, Dice.d6 * 2).add(DamageType.Force, 4).add(DamageType.Radiant, 3)
+    multipliers = damage_multipliers(resistances=[DamageType.Fire], immunities=[DamageType.Radiant], vulnerabilities=[DamageType.Force])
+    # Halved 2d6 is rounded down, odd totals lose 1/2
+    assert damage.avg(multipliers) == Fraction(7, 2) - Fraction(1, 4) + 8
+    assert damage.repr_multiplied(multipliers) == 'Damage(Fire: floor(2d6 * 1/2), Force: 4 * 2, Radiant: 3 * 0)'
+    character = Character(
+        name='target', ability_scores={ability: 10 for ability in Ability},
+        damage_multipliers=multipliers, track_damage_distribution=True,
+    )
+    character.takes_damage(damage)
+    assert character.expected_damage_taken == damage.avg(multipliers)
+    assert character.damage_distribution is not None
+    assert character.damage_distribution.moments().mean == character.expected_damage_taken
+    assert character.damage_distribution.min_value() == 1 + 8 and character.damage_distribution.max_value() == 6 + 8
+
+
+def unpickled_damage(data: bytes) -> tuple[str, Fraction]:
+    # A fresh process registers dice rolls in another order than the one which pickled the damage
+    dice_roll_column(DiceRoll(Dice.d4))
+    damage = pickle.loads(data)
+    return repr(damage), damage.avg()
+
+
+def test_damage_pickling_does_not_depend_on_dice_roll_registration():
+    damage = Damage().add(DamageType.Force, Dice.d10).add(DamageType.Force, 4)
+    damage[DamageType.Fire] += DiceBag(dices={DiceRoll(Dice.d8, rerolling=frozenset({1, 2})): 2})
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        assert executor.submit(unpickled_damage, pickle.dumps(damage)).result() == (repr(damage), damage.avg())
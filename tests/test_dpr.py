@@ -6,9 +6,10 @@ import pytest
 
 import utils
 from damage import Damage, DamageType
-from dices import Dice, DiceBag
+from dices import Dice, DiceBag, DiceRoll
 from factory import LightFootHalflingRogue, SimpleRogue, SimpleWarlock
 from main import exhaust_tree
+from probability import ProbabilityMode, probability_mode
 from tree import find_best_strategy
 
 LOGGER = logging.getLogger('dnd')
@@ -31,6 +32,7 @@ def test_damage():
     critical_dmg = dmg.as_critical()
     LOGGER.debug(f'{critical_dmg=} {critical_dmg.avg()=}')
     assert dmg.as_critical().avg() == Fraction(11, 1)
+    assert critical_dmg[DamageType.Force].dices == {DiceRoll(Dice.d10): 2}
 
 
 class BaseDPRCalculator:
@@ -98,13 +100,22 @@ def test_simple_warlock(level: int):
     simple_warlock = SimpleWarlock(level=level)
     state = simple_warlock.get_test_state()
     tree = exhaust_tree(state)
-    best_strategy = find_best_strategy(tree)
+    best_strategy = find_best_strategy(tree, explain=True)
     warlock_score = best_strategy.scores[simple_warlock.character.name]
     LOGGER.debug(utils.repr_history(warlock_score.history))
     LOGGER.debug(warlock_score.value)
     assert warlock_score.value == ExpectedDPRCalculator.simple_warlock(level)
 
 
+def test_simple_warlock_float_mode():
+    simple_warlock = SimpleWarlock(level=2)
+    with probability_mode(ProbabilityMode.FLOAT):
+        best_strategy = find_best_strategy(exhaust_tree(simple_warlock.get_test_state()))
+    warlock_score = best_strategy.scores[simple_warlock.character.name]
+    assert isinstance(warlock_score.value, float)
+    assert warlock_score.value == pytest.approx(float(ExpectedDPRCalculator.simple_warlock(2)))
+
+
 @pytest.mark.parametrize(
         argnames='level',
         argvalues=list(range(1, 5))
@@ -113,7 +124,7 @@ def test_simple_rogue(level: int):
     simple_rogue = SimpleRogue(level)
     test_state = simple_rogue.get_test_state()
     tree = exhaust_tree(test_state)
-    best_strategy = find_best_strategy(tree)
+    best_strategy = find_best_strategy(tree, explain=True)
     rogue_score = best_strategy.scores[simple_rogue.character.name]
     LOGGER.debug(utils.repr_history(rogue_score.history))
     LOGGER.debug(rogue_score.value)
@@ -128,7 +139,7 @@ def test_light_foot_halfling_rogue(level: int):
     light_foot_halfling_rogue = LightFootHalflingRogue(level)
     test_state = light_foot_halfling_rogue.get_test_state()
     tree = exhaust_tree(test_state)
-    best_strategy = find_best_strategy(tree)
+    best_strategy = find_best_strategy(tree, explain=True)
     rogue_score = best_strategy.scores[light_foot_halfling_rogue.character.name]
     LOGGER.debug(utils.repr_history(rogue_score.history))
     LOGGER.debug(rogue_score.value)
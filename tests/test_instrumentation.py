@@ -0,0 +1,42 @@
+import copy
+import json
+
+from factory import SimpleRogue, SimpleWarlock
+from instrumentation import get_recorder, recording
+from main import exhaust_tree
+from mcts import MonteCarloTreeSearch
+from node_store import NodeStore
+from search import DepthFirstSearch, ParallelSearch
+
+
+def test_recording():
+    state = SimpleRogue(2).get_test_state()
+    search = DepthFirstSearch()
+    with recording() as recorder:
+        search.find_best_strategy(state)
+    assert get_recorder() is None
+    assert sum(recorder.nodes_per_depth.values()) == search.statistics.nodes
+    assert recorder.module_timings['WeaponAttack (rogue)'].calls > 0
+    assert recorder.event_steps[('ActionEvent', 'BEFORE_ATTACK')] > 0
+    exported = json.loads(json.dumps(recorder.to_dict()))
+    assert exported['nodes_per_depth']['0'] == 1
+    assert 'SneakAttack (rogue)' in recorder.report()
+
+
+def test_every_search_records_nodes_per_depth():
+    state = SimpleWarlock(5).get_test_state()
+    with recording() as expected:
+        DepthFirstSearch().find_best_strategy(copy.deepcopy(state))
+    with recording() as tree_recorder:
+        exhaust_tree(copy.deepcopy(state))
+    with recording() as store_recorder:
+        NodeStore.exhaust(copy.deepcopy(state))
+    assert tree_recorder.nodes_per_depth == store_recorder.nodes_per_depth == expected.nodes_per_depth
+    # Workers recorders are merged into the caller one
+    with recording() as parallel_recorder:
+        ParallelSearch(split_depth=2, max_workers=2).find_best_strategy(copy.deepcopy(state))
+    assert parallel_recorder.nodes_per_depth == expected.nodes_per_depth
+    assert parallel_recorder.event_steps == expected.event_steps
+    with recording() as mcts_recorder:
+        MonteCarloTreeSearch(iterations=10, seed=0).search(copy.deepcopy(state))
+    assert mcts_recorder.nodes_per_depth[0] == 10
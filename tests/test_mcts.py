@@ -0,0 +1,31 @@
+import copy
+
+import pytest
+
+from factory import LightFootHalflingRogue, SimpleWarlock
+from mcts import (MonteCarloTreeSearch, action_first_rollout_policy,
+                  random_rollout_policy)
+from search import DepthFirstSearch
+
+
+@pytest.mark.parametrize(argnames='rollout_policy', argvalues=[random_rollout_policy, action_first_rollout_policy])
+def test_mcts_finds_best_choices(rollout_policy):
+    state = LightFootHalflingRogue(2).get_test_state()
+    expected = DepthFirstSearch().find_best_strategy(copy.deepcopy(state))
+    result = MonteCarloTreeSearch(iterations=1000, seed=0, rollout_policy=rollout_policy).search(state)
+    assert result.iterations == 1000
+    assert result.best_choices() == expected.choices
+    decision_node = result.root.most_visited_child()
+    assert decision_node.deciding_creature_id == 'rogue'
+    assert sum(decision_node.visit_counts().values()) == decision_node.visits - 1 # First visit expanded it
+    action_values = decision_node.action_values()
+    assert max(action_values, key=lambda name: action_values[name]) == 'HideAction on punching_ball'
+
+
+def test_mcts_is_reproducible():
+    state = SimpleWarlock(5).get_test_state()
+    first = MonteCarloTreeSearch(iterations=200, seed=1).search(copy.deepcopy(state))
+    second = MonteCarloTreeSearch(iterations=200, seed=1).search(state)
+    assert first.root.total_scores == second.root.total_scores
+    with pytest.raises(ValueError):
+        MonteCarloTreeSearch(iterations=None)
@@ -0,0 +1,36 @@
+import copy
+
+import pytest
+
+from benchmark import measure, node_store_search, tree_search
+from factory import LightFootHalflingRogue, SimpleRogue, SimpleWarlock
+from node_store import NodeStore
+from search import DepthFirstSearch
+from state import State
+
+
+@pytest.mark.parametrize(
+        argnames='state',
+        argvalues=[
+            SimpleRogue(2).get_test_state(),
+            SimpleWarlock(5).get_test_state(),
+            LightFootHalflingRogue(2).get_test_state(),
+        ]
+)
+def test_node_store_matches_depth_first_search(state: State):
+    search = DepthFirstSearch()
+    expected = search.find_best_strategy(copy.deepcopy(state))
+    store = NodeStore.exhaust(state)
+    assert len(store) == search.statistics.nodes
+    assert store.best_choices() == expected.choices
+    root_values = store.values()[0]
+    for creature_index, creature_name in enumerate(store.creature_names):
+        assert root_values[creature_index] == pytest.approx(float(expected.scores[creature_name].value))
+
+
+def test_node_store_is_compact():
+    state = SimpleWarlock(5).get_test_state()
+    tree_result = measure('tree', state, tree_search)
+    node_store_result = measure('node store', state, node_store_search)
+    assert tree_result.nodes == node_store_result.nodes
+    assert node_store_result.peak_memory_per_node() < tree_result.peak_memory_per_node()
@@ -0,0 +1,136 @@
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from dices import DISTRIBUTION_CACHE, Dice, DiceBag, DiceRoll
+from probability import (DictRandomVariable, ProbabilityMode,
+                         RandomVariable, UnreducedFraction,
+                         advantage_disadvantage, probability_mode)
+
+
+def test_array_backend_matches_dict_backend():
+    d20 = RandomVariable.from_range(1, 20)
+    reference_d20 = DictRandomVariable.from_range(1, 20)
+    d6 = RandomVariable.from_range(1, 6)
+    reference_d6 = DictRandomVariable.from_range(1, 6)
+
+    rolled = d20 + d6 + d6 - d6 + 3
+    reference_rolled = reference_d20 + reference_d6 + reference_d6 - reference_d6 + 3
+    assert rolled.outcomes == reference_rolled.outcomes
+    for threshold in range(-10, 40):
+        assert rolled.probability_of_being_superior_or_equal_to(threshold) == \
+            reference_rolled.probability_of_being_superior_or_equal_to(threshold)
+
+    for advantage, disadvantage in [(True, False), (False, True)]:
+        merge_function = max if advantage else min
+        assert advantage_disadvantage(d20, advantage, disadvantage).outcomes == \
+            reference_d20.merge(reference_d20, merge_function).outcomes
+
+
+def test_reroll_on_values():
+    d6 = RandomVariable.from_range(1, 6)
+    d6.reroll_on_values({1, 2})
+    reference_d6 = DictRandomVariable.from_range(1, 6)
+    reference_d6.reroll_on_values({1, 2})
+    assert d6.outcomes == reference_d6.outcomes
+    with pytest.raises(ValueError):
+        d6.reroll_on_values([7])
+
+
+def test_fft_convolution():
+    d100 = RandomVariable.from_range(1, 100)
+    exact_sum = d100 + d100
+    float_sum = d100.to_float() + d100.to_float()
+    assert float_sum.offset == exact_sum.offset
+    assert np.allclose(float_sum.probabilities, exact_sum.probabilities.astype(np.float64))
+    assert exact_sum.mean() == Fraction(101)
+
+
+def test_distribution_cache():
+    DISTRIBUTION_CACHE.clear()
+    DISTRIBUTION_CACHE.resize(2)
+    first = (Dice.d6 * 2 + 3).as_random_variable()
+    second = (DiceBag(fix=3) + Dice.d6 + Dice.d6).as_random_variable()
+    assert first is second
+    assert DISTRIBUTION_CACHE.statistics.hits == 1 # second bag
+    assert DISTRIBUTION_CACHE.statistics.misses == 3 # first bag, 2d6 sum and d6 roll
+    with pytest.raises(ValueError):
+        first.reroll_on_values([5])
+    with pytest.raises(ValueError):
+        first.weights[0] = 0
+    assert DISTRIBUTION_CACHE.statistics.evictions == 1
+    DiceRoll(Dice.d8, advantage=True).as_random_variable()
+    assert DISTRIBUTION_CACHE.statistics.evictions == 2
+    assert len(DISTRIBUTION_CACHE) == 2
+    DISTRIBUTION_CACHE.resize(4096)
+
+
+@pytest.mark.parametrize(
+        argnames='dice_bag',
+        argvalues=[
+            Dice.d6 * 3 + 2,
+            DiceBag(fix=1) + DiceRoll(Dice.d20, advantage=True) - Dice.d4,
+            DiceBag() + DiceRoll(Dice.d10, disadvantage=True) + DiceRoll(Dice.d12, rerolling={1, 2}),
+        ]
+)
+def test_moments_match_distribution(dice_bag: DiceBag):
+    assert dice_bag.moments() == dice_bag.as_random_variable().moments()
+
+
+def test_unreduced_fraction():
+    a = UnreducedFraction(3, 20)
+    b = UnreducedFraction(1, 400)
+    assert (a + b).denominator == 400 # aligned without gcd
+    assert a + b == Fraction(61, 400)
+    assert 1 - a == Fraction(17, 20)
+    assert a * Fraction(7, 2) == Fraction(21, 40)
+    assert str(UnreducedFraction(2, 4)) == '1/2'
+    assert Fraction(1, 10) <= a
+    assert a / UnreducedFraction(-1, 4) == Fraction(-3, 5)
+    assert Fraction(1, 2) / a == Fraction(10, 3)
+
+
+def test_float_mode():
+    with probability_mode(ProbabilityMode.FLOAT):
+        roll = advantage_disadvantage(RandomVariable.from_range(1, 20), True, False) + 5
+        float_probability = roll.probability_of_being_superior_or_equal_to(15)
+    exact_roll = advantage_disadvantage(RandomVariable.from_range(1, 20), True, False) + 5
+    exact_probability = exact_roll.probability_of_being_superior_or_equal_to(15)
+    assert isinstance(float_probability, float)
+    assert isinstance(exact_probability, UnreducedFraction)
+    assert float_probability == pytest.approx(float(exact_probability))
+
+
+def test_counted_dice_bag():
+    sneak_attack = Dice.d6 * 10
+    assert sneak_attack.dices == {DiceRoll(Dice.d6): 10}
+    iterative_sum = RandomVariable.from_values([0])
+    for _ in range(10):
+        iterative_sum = iterative_sum + Dice.d6.as_random_variable()
+    assert sneak_attack.as_random_variable().outcomes == iterative_sum.outcomes
+    assert (sneak_attack - Dice.d6 * 10 + 2).key() == DiceBag(fix=2).key()
+    assert (sneak_attack - Dice.d4 + 2).max_value() == 61
+    assert DiceBag() + DiceRoll(Dice.d4, rerolling=[1]) == DiceBag(dices={DiceRoll(Dice.d4, rerolling=frozenset({1})): 1})
+
+
+def test_order_statistics():
+    d20 = RandomVariable.from_range(1, 20)
+    reference_d20 = DictRandomVariable.from_range(1, 20)
+    elven_accuracy = reference_d20.merge(reference_d20, max).merge(reference_d20, max)
+    assert d20.highest_of(3).outcomes == elven_accuracy.outcomes
+    middle_of_three = DictRandomVariable.from_values([
+        sorted((a, b, c))[1] for a in range(1, 7) for b in range(1, 7) for c in range(1, 7)
+    ])
+    assert RandomVariable.from_range(1, 6).order_statistic(3, 2).outcomes == middle_of_three.outcomes
+    shifted = d20 + 4
+    reference_shifted = reference_d20 + 4
+    assert d20.max_of(shifted).outcomes == reference_d20.merge(reference_shifted, max).outcomes
+    assert d20.min_of(shifted).outcomes == reference_d20.merge(reference_shifted, min).outcomes
+
+
+def test_probability_of_being_superior_to():
+    stealth = advantage_disadvantage(RandomVariable.from_range(1, 20), True, False) + 7
+    perception = RandomVariable.from_range(1, 20) + 2
+    assert stealth.probability_of_being_superior_to(perception) == \
+        (stealth - perception).probability_of_being_superior_or_equal_to(1)
@@ -0,0 +1,24 @@
+import numpy as np
+
+from damage import Damage, DamageType
+from dices import Dice, DiceRoll
+from probability import RandomVariable, to_fraction
+from sampling import SampleSummary, random_generator
+
+
+def test_sampling_is_seeded():
+    dice_bag = Dice.d6 * 10 + 3
+    first = dice_bag.sample(1000, random_generator(seed=42))
+    second = dice_bag.sample(1000, random_generator(seed=42))
+    assert np.array_equal(first, second)
+
+
+def test_sampling_matches_exact_means():
+    generator = random_generator(seed=0)
+    damage = Damage().add(DamageType.Piercing, Dice.d6 * 2 + 3).add(DamageType.Fire, DiceRoll(Dice.d10, advantage=True))
+    summary = SampleSummary.from_samples(damage.sample(200_000, generator))
+    assert summary.is_consistent_with(float(damage.avg()))
+    rand_var = RandomVariable.from_range(1, 20) + RandomVariable.from_range(1, 4)
+    summary = SampleSummary.from_samples(rand_var.sample(200_000, generator))
+    assert summary.is_consistent_with(float(to_fraction(rand_var.mean())))
+    assert summary.quantiles[0.5] == 13
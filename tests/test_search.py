@@ -0,0 +1,205 @@
+import copy
+
+import pytest
+
+from damage import Damage, DamageType, damage_multipliers
+from dices import Dice
+
+from factory import (LightFootHalflingRogue, SimpleRogue, SimpleWarlock,
+                     TheGenie)
+from main import exhaust_tree
+from probability import ProbabilityMode, probability_mode
+from search import (DamageBounds, DepthFirstSearch, IterativeDeepeningSearch,
+                    ParallelSearch, PrunedSearch, TranspositionTable)
+from state import State
+from tree import Strategy, TreeNode, find_best_strategy
+from utils import repr_history
+
+
+def count_nodes(node: TreeNode) -> int:
+    return 1 + sum(count_nodes(child) for child in node.children)
+
+
+def assert_same_strategy(strategy: Strategy, expected: Strategy) -> None:
+    """Same choices and score values, histories are not compared"""
+    assert strategy.choices == expected.choices
+    assert {name: score.value for name, score in strategy.scores.items()} == \
+        {name: score.value for name, score in expected.scores.items()}
+
+
+@pytest.mark.parametrize(
+        argnames='state',
+        argvalues=[
+            SimpleRogue(2).get_test_state(),
+            SimpleWarlock(5).get_test_state(),
+            LightFootHalflingRogue(2).get_test_state(),
+        ]
+)
+def test_depth_first_search_matches_exhaustive_search(state: State):
+    root_node = exhaust_tree(copy.deepcopy(state))
+    expected = find_best_strategy(root_node)
+    search = DepthFirstSearch()
+    assert_same_strategy(search.find_best_strategy(state), expected)
+    assert search.statistics.nodes == count_nodes(root_node)
+    assert search.statistics.leaves > 0
+
+
+def test_transposition_table():
+    state = SimpleWarlock(5).get_test_state()
+    expected = DepthFirstSearch().find_best_strategy(copy.deepcopy(state))
+    transposition_table = TranspositionTable()
+    search = DepthFirstSearch(transposition_table=transposition_table)
+    assert_same_strategy(search.find_best_strategy(state), expected)
+    assert transposition_table.statistics.hits > 0
+    assert transposition_table.statistics.misses == search.statistics.nodes
+    # Strategies of another horizon or arithmetic cannot be reused
+    with pytest.raises(ValueError):
+        DepthFirstSearch(absolute_round_limit=2, transposition_table=transposition_table).find_best_strategy(state)
+    with probability_mode(ProbabilityMode.FLOAT), pytest.raises(ValueError):
+        search.find_best_strategy(state)
+    transposition_table.clear()
+    DepthFirstSearch(absolute_round_limit=2, transposition_table=transposition_table).find_best_strategy(state)
+
+
+def test_state_fingerprint():
+    state = SimpleRogue(2).get_test_state()
+    state_copy = copy.deepcopy(state)
+    assert state.fingerprint() == state_copy.fingerprint()
+    state_copy.forward_until_branch()
+    assert state.fingerprint() != state_copy.fingerprint()
+
+
+def test_save_restore_rolls_back_outcomes():
+    state = LightFootHalflingRogue(2).get_test_state()
+    to_do = [state]
+    while len(to_do) > 0:
+        state = to_do.pop()
+        possible_outcomes = state.forward_until_branch(absolute_round_limit=1)
+        if possible_outcomes is None:
+            continue
+        fingerprint = state.fingerprint()
+        for outcome_index in range(len(possible_outcomes)):
+            state_copy = copy.deepcopy(state)
+            state_copy.do_outcome(outcome_index)
+            snapshot = state.save()
+            state.do_outcome(outcome_index)
+            assert state.fingerprint() == state_copy.fingerprint()
+            state.restore(snapshot)
+            for _ in range(2): # Snapshots can be restored several times
+                state.do_outcome(outcome_index)
+                state.forward_until_branch(absolute_round_limit=1)
+                state.restore(snapshot)
+                assert state.fingerprint() == fingerprint
+            to_do.append(state_copy)
+
+
+@pytest.mark.parametrize(argnames='split_depth', argvalues=[0, 2, 5, 100])
+def test_parallel_search_matches_depth_first_search(split_depth: int):
+    state = SimpleWarlock(5).get_test_state()
+    search = DepthFirstSearch()
+    expected = search.find_best_strategy(copy.deepcopy(state))
+    parallel_search = ParallelSearch(split_depth=split_depth, max_workers=2)
+    strategy = parallel_search.find_best_strategy(state)
+    assert_same_strategy(strategy, expected)
+    assert parallel_search.statistics.nodes == search.statistics.nodes
+    assert parallel_search.statistics.leaves == search.statistics.leaves
+    # Workers do not receive the hits already taken, explanations are rebased on them
+    assert_explanations_match(strategy, expected.explained())
+
+
+def test_parallel_search_workers_use_the_probability_mode():
+    state = SimpleWarlock(5).get_test_state()
+    with probability_mode(ProbabilityMode.FLOAT):
+        expected = DepthFirstSearch().find_best_strategy(copy.deepcopy(state))
+        # Spawned workers do not inherit the module globals of the caller
+        strategy = ParallelSearch(split_depth=1, max_workers=2, start_method='spawn').find_best_strategy(state)
+    assert isinstance(expected.scores['warlock'].value, float)
+    assert strategy.scores['warlock'].value == pytest.approx(expected.scores['warlock'].value)
+    assert type(strategy.scores['warlock'].value) is type(expected.scores['warlock'].value)
+
+
+@pytest.mark.parametrize(argnames='absolute_round_limit', argvalues=[1, 2])
+def test_pruned_search_matches_depth_first_search(absolute_round_limit: int):
+    state = SimpleWarlock(5).get_test_state()
+    expected = DepthFirstSearch(absolute_round_limit=absolute_round_limit).find_best_strategy(copy.deepcopy(state))
+    # Two eldritch blasts with agonizing blast (+4) per turn, both critical
+    max_damage_per_attack = Damage().add(DamageType.Force, Dice.d10).as_critical().max_value() + 4
+    search = PrunedSearch(
+        bounds=DamageBounds(max_damage_per_attack, attacks_per_turn=2, absolute_round_limit=absolute_round_limit),
+        absolute_round_limit=absolute_round_limit,
+    )
+    assert_same_strategy(search.find_best_strategy(state), expected)
+    # Ending the turn early cannot beat a blast: no attack is left before the round limit
+    assert search.statistics.pruned > 0
+
+
+def test_probability_threshold_error_bound():
+    state = SimpleWarlock(5).get_test_state()
+    expected = DepthFirstSearch().find_best_strategy(copy.deepcopy(state))
+    search = DepthFirstSearch(probability_threshold=0.01, bounds=DamageBounds(max_damage_per_attack=24, attacks_per_turn=2))
+    strategy = search.find_best_strategy(state)
+    assert search.statistics.truncated > 0
+    assert 0 < search.statistics.truncated_probability < 1
+    error = expected.scores['warlock'].value - strategy.scores['warlock'].value
+    assert 0 <= error <= search.statistics.error_bound
+    with pytest.raises(ValueError):
+        DepthFirstSearch(probability_threshold=0.01)
+
+
+def test_iterative_deepening_search():
+    state = SimpleWarlock(5).get_test_state()
+    expected = DepthFirstSearch().find_best_strategy(copy.deepcopy(state))
+    result = IterativeDeepeningSearch(node_budget=100_000).find_best_strategy(state)
+    assert result.completed
+    assert result.strategy is not None
+    assert_same_strategy(result.strategy, expected)
+    interrupted_result = IterativeDeepeningSearch(node_budget=100).find_best_strategy(state)
+    assert not interrupted_result.completed
+    assert 0 < interrupted_result.depth_limit < result.depth_limit
+    assert interrupted_result.nodes <= 101
+
+
+def assert_explanations_match(strategy: Strategy, expected: Strategy) -> None:
+    assert all(score.history is None for score in strategy.scores.values())
+    explained_strategy = strategy.explained()
+    assert explained_strategy.choices == expected.choices
+    for creature_id, score in expected.scores.items():
+        explained_score = explained_strategy.scores[creature_id]
+        assert explained_score.value == score.value == strategy.scores[creature_id].value
+        assert explained_score.history is not None and score.history is not None
+        assert repr_history(explained_score.history) == repr_history(score.history)
+
+
+@pytest.mark.parametrize(
+        argnames='state',
+        argvalues=[SimpleWarlock(5).get_test_state(), TheGenie(5).get_test_state()]
+)
+def test_explanations_are_rebuilt_for_the_chosen_line(state: State):
+    expected = find_best_strategy(exhaust_tree(copy.deepcopy(state)), explain=True)
+    assert_explanations_match(DepthFirstSearch().find_best_strategy(state), expected)
+
+
+@pytest.mark.parametrize(
+        argnames='state',
+        argvalues=[
+            SimpleWarlock(5).get_test_state(),
+            SimpleWarlock(11).get_test_state(),
+            TheGenie(5).get_test_state(),
+            TheGenie(11).get_test_state(),
+        ]
+)
+def test_explanations_with_transposition_table(state: State):
+    expected = find_best_strategy(exhaust_tree(copy.deepcopy(state)), explain=True)
+    # Transpositions are reached with other hits, reused strategies are explained with the hits of the chosen line
+    strategy = DepthFirstSearch(transposition_table=TranspositionTable()).find_best_strategy(state)
+    assert_explanations_match(strategy, expected)
+
+
+def test_explanations_show_damage_multipliers():
+    state = SimpleWarlock(5).get_test_state()
+    state.creatures[0].damage_multipliers = damage_multipliers(resistances=[DamageType.Force])
+    strategy = DepthFirstSearch().find_best_strategy(state).explained()
+    history = strategy.scores['warlock'].history
+    assert history is not None
+    assert 'avg(Damage(Force: floor((d10 + 4) * 1/2)))' in repr_history(history)
+    assert strategy.scores['warlock'].value < DepthFirstSearch().find_best_strategy(SimpleWarlock(5).get_test_state()).scores['warlock'].value
@@ -0,0 +1,121 @@
+import copy
+from fractions import Fraction
+
+import pytest
+
+from ability import Ability
+from action import (ActionEvent, ActionModule, ChoosingActionEvent,
+                    WorkFlowPattern)
+from character import Character
+from damage import Damage, DamageType
+from dices import Dice
+from event import (Choice, Event, EventSteps, RandomOutcome, StartOfTurnEvent,
+                   transition_validation)
+from factory import SimpleWarlock
+from feature import StartOfTurnFeature
+from module import Module, Subscription
+from search import DepthFirstSearch
+
+
+class UnsubscribedModule(Module):
+    subscriptions = (Subscription(event_types=()),)
+
+    def on_event(self, event: Event, chosen_outcome: RandomOutcome | Choice | None) -> Event | None:
+        raise AssertionError('Module should never be dispatched an event')
+
+
+def test_modules_are_only_dispatched_subscribed_events():
+    state = SimpleWarlock(5).get_test_state()
+    padded_state = copy.deepcopy(state)
+    padded_state.modules = [UnsubscribedModule() for _ in range(20)] + padded_state.modules
+    padded_state.reset_indexes()
+    search = DepthFirstSearch()
+    expected = search.find_best_strategy(state)
+    padded_search = DepthFirstSearch()
+    strategy = padded_search.find_best_strategy(padded_state)
+    assert strategy.choices == expected.choices
+    assert strategy.scores['warlock'].value == expected.scores['warlock'].value
+    subscribers = state.event_subscribers(StartOfTurnEvent(origin_character=state.creatures[0]))
+    assert [type(state.modules[index]) for index in subscribers] == [StartOfTurnFeature]
+    # Copies share indexes until they are reset
+    state_copy = copy.deepcopy(state)
+    assert state_copy.subscribers is state.subscribers and state_copy.modules is not state.modules
+    state_copy.reset_indexes()
+    assert state_copy.subscribers == {} and len(state.subscribers) > 0
+    eldritch_blast = state.modules[0]
+    assert eldritch_blast.is_subscribed(ChoosingActionEvent, EventSteps.AFTER_EVENT, 'warlock')
+    assert not eldritch_blast.is_subscribed(ChoosingActionEvent, EventSteps.AFTER_EVENT, 'punching_ball')
+    assert not eldritch_blast.is_subscribed(StartOfTurnEvent, EventSteps.BEFORE_EVENT, 'warlock')
+
+
+def test_transition_tables_follow_the_workflow():
+    assert WorkFlowPattern.ATTACK.transitions().random_steps[EventSteps.BEFORE_SAVING_THROW.ordinal] == frozenset()
+    assert WorkFlowPattern.SAVE.transitions().random_steps[EventSteps.BEFORE_SAVING_THROW.ordinal] == {EventSteps.FAIL_SAVE, EventSteps.SUCCESSFUL_SAVE}
+    for workflow_pattern in WorkFlowPattern:
+        next_steps = workflow_pattern.transitions().next_steps
+        for step in EventSteps:
+            try:
+                expected = workflow_pattern.next_step(step)
+            except NotImplementedError:
+                expected = None
+            assert next_steps[step.ordinal] is expected
+    state = SimpleWarlock(5).get_test_state()
+    expected = DepthFirstSearch().find_best_strategy(state)
+    with transition_validation():
+        strategy = DepthFirstSearch().find_best_strategy(state)
+        state.forward_until_branch()
+        state.do_outcome(0) # Punching ball ends its turn
+        possible_outcomes = state.forward_until_branch()
+        assert possible_outcomes is not None
+        event = next(outcome.instantiate() for outcome in possible_outcomes if isinstance(outcome, Choice) and isinstance(outcome.choice, ActionEvent))
+        event.event_step = EventSteps.BEFORE_ATTACK
+        with pytest.raises(ValueError):
+            event.do_outcome(RandomOutcome(name=EventSteps.FAIL_SAVE, probability=1))
+        # Eldritch blast has no saving throw, outcomes of other patterns are rejected
+        event.event_step = EventSteps.BEFORE_SAVING_THROW
+        with pytest.raises(ValueError):
+            event.do_outcome(RandomOutcome(name=EventSteps.FAIL_SAVE, probability=1))
+    assert strategy.choices == expected.choices
+    assert strategy.scores['warlock'].value == expected.scores['warlock'].value
+
+
+def test_action_templates_are_reused_and_only_hostile_creatures_are_targeted():
+    state = SimpleWarlock(5).get_test_state()
+    state.creatures.append(Character(name='ally', ability_scores={ability: 10 for ability in Ability}, team='heroes'))
+    state.creatures[1].team = 'heroes'
+    state.reset_indexes()
+    state.forward_until_branch()
+    state.do_outcome(0) # Punching ball ends its turn
+    choices = state.forward_until_branch()
+    assert choices is not None
+    assert [choice.name for choice in choices] == ['EldritchBlast on punching_ball', 'EndOfTurnEvent']
+    blast = choices[0]
+    assert isinstance(blast, Choice)
+    snapshot = state.save()
+    state.do_outcome(0)
+    chosen_event = state.current_event()
+    assert isinstance(chosen_event, ActionEvent) and chosen_event is not blast.choice
+    assert chosen_event.target is state.creatures[0]
+    assert chosen_event.attack is not None and blast.choice.attack is not None
+    assert chosen_event.attack is not blast.choice.attack
+    state.restore(snapshot)
+    eldritch_blast = state.modules[0]
+    assert isinstance(eldritch_blast, ActionModule)
+    assert eldritch_blast.get_action_template() is blast.choice
+
+
+def test_running_damage_totals_follow_damage_taken():
+    character = Character(name='target', ability_scores={ability: 10 for ability in Ability}, track_damage_distribution=True)
+    character.takes_damage(Damage().add(DamageType.Force, Dice.d10))
+    snapshot = character.save()
+    character.takes_damage(Damage().add(DamageType.Fire, Dice.d6 * 2).add(DamageType.Force, 3))
+    assert character.expected_damage_taken == sum(damage.avg() for damage in character.damage_taken())
+    assert character.damage_distribution is not None
+    assert character.damage_distribution.mean() == character.expected_damage_taken
+    assert character.damage_distribution.max_value() == 10 + 12 + 3
+    # Copies share the hits instead of copying a list growing with the fight
+    assert copy.deepcopy(character).last_damage_taken is character.last_damage_taken
+    character.restore(snapshot)
+    assert len(character.damage_taken()) == 1
+    assert character.expected_damage_taken == Fraction(11, 2)
+    assert character.damage_distribution is not None and character.damage_distribution.max_value() == 10